@@ -0,0 +1,293 @@
+"""Benchmarks for the fingerprinting service (finger.py).
+
+Everything runs locally on synthetic media and catalogs, so no fixtures or
+network are needed:
+
+    python bench_finger.py --output bench.json
+    python bench_finger.py --catalog-sizes 1000 10000 100000 1000000 --queries 200
+
+Reports ingest throughput (seconds of media fingerprinted per second),
+query p50/p99 latency against catalog size, peak RSS, and recall under
+re-encoding / cropping / audio degradation, as one JSON document.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import cv2
+import librosa
+import numpy as np
+import soundfile as sf
+
+import finger
+
+# ================= HELPERS =================
+def peak_rss_mb():
+    """Peak resident set size of this process so far (ru_maxrss is KiB on Linux, bytes on macOS)."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else None
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+# ================= SYNTHETIC MEDIA =================
+def make_video(path, seconds, seed, fps=25, size=(320, 240), fourcc="MJPG", quality=None,
+               crop=0.0):
+    """Moving shapes over a drifting background, deterministic for a seed.
+
+    crop trims that fraction from every edge and scales back up, like a
+    re-framed pirate copy; quality sets the MJPG quality of a re-encode.
+    """
+    rng = np.random.default_rng(seed)
+    width, height = size
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*fourcc), fps, size)
+    if quality is not None:
+        writer.set(cv2.VIDEOWRITER_PROP_QUALITY, quality)
+    colours = rng.integers(0, 256, size=(8, 3))
+    speeds = rng.uniform(1, 6, size=(8, 2))
+    radii = rng.integers(10, 50, size=8)
+    for i in range(int(seconds * fps)):
+        scene = i // (fps * 3)  # cut every 3 s so frames don't all look alike
+        frame = np.empty((height, width, 3), dtype=np.uint8)
+        frame[:] = colours[scene % 8] // 3
+        for j in range(8):
+            x = int((speeds[j, 0] * i + 40 * j + scene * 17) % width)
+            y = int((speeds[j, 1] * i + 25 * j) % height)
+            cv2.circle(frame, (x, y), int(radii[j]), tuple(int(c) for c in colours[(j + scene) % 8]), -1)
+        if crop:
+            dx, dy = int(width * crop), int(height * crop)
+            frame = cv2.resize(frame[dy:height - dy, dx:width - dx], size)
+        writer.write(frame)
+    writer.release()
+    return path
+
+def make_audio(path, seconds, seed, sr=finger.AUDIO_SR):
+    """Random chord sequence plus light noise, deterministic for a seed."""
+    rng = np.random.default_rng(seed)
+    note = int(sr * 0.25)
+    t = np.arange(note) / sr
+    notes = []
+    for _ in range(int(seconds / 0.25)):
+        freqs = rng.uniform(150, 3000, size=3)
+        notes.append(sum(np.sin(2 * np.pi * f * t) for f in freqs) * 0.2 * np.hanning(note))
+    y = np.concatenate(notes) + 0.003 * rng.standard_normal(note * len(notes))
+    sf.write(path, y.astype(np.float32), sr)
+    return path
+
+def degrade_audio(src, dst, gain=0.5, noise=0.01, sr=16000, seed=0):
+    """Gain change, added noise and resampling: a typical camcorder/re-encode copy."""
+    y, orig_sr = sf.read(src, dtype="float32")
+    y = y * gain + noise * np.random.default_rng(seed).standard_normal(len(y)).astype(np.float32)
+    sf.write(dst, librosa.resample(y, orig_sr=orig_sr, target_sr=sr), sr)
+    return dst
+
+def excerpt_audio(src, dst, start, seconds):
+    y, sr = sf.read(src, dtype="float32")
+    sf.write(dst, y[int(start * sr):int((start + seconds) * sr)], sr)
+    return dst
+
+# ================= INGEST THROUGHPUT =================
+def bench_ingest(workdir, titles, seconds):
+    """Fingerprint and store synthetic titles; report media-seconds per second per stage."""
+    db_path = os.path.join(workdir, "ingest.db")
+    finger.create_tables(db_path)
+    conn = finger.get_connection(db_path)
+    media = []
+    totals = {"audio": 0.0, "video": 0.0, "db": 0.0}
+    for i in range(titles):
+        audio_path = make_audio(os.path.join(workdir, f"title{i}.wav"), seconds, seed=i)
+        video_path = make_video(os.path.join(workdir, f"title{i}.avi"), seconds, seed=i)
+        (audio, duration), t_audio = timed(finger.audio_fingerprint, audio_path)
+        visual, t_video = timed(finger.video_fingerprint, video_path)
+        vid, t_db = timed(finger.store_fingerprints, conn, video_path, f"title{i}", duration,
+                          audio, visual)
+        totals["audio"] += t_audio
+        totals["video"] += t_video
+        totals["db"] += t_db
+        media.append({"video_id": vid, "audio": audio_path, "video": video_path})
+    conn.close()
+    media_seconds = titles * seconds
+    report = {"titles": titles, "media_seconds": media_seconds, "peak_rss_mb": peak_rss_mb()}
+    for stage, spent in totals.items():
+        report[f"{stage}_seconds"] = spent
+        report[f"{stage}_media_seconds_per_second"] = media_seconds / spent if spent else None
+    spent = sum(totals.values())
+    report["total_media_seconds_per_second"] = media_seconds / spent if spent else None
+    return report, db_path, media
+
+# ================= QUERY LATENCY VS CATALOG SIZE =================
+def build_synthetic_catalog(db_path, stored_hashes, hashes_per_video=2000, seed=0):
+    """Fill a catalog with stored_hashes random rows in each hash table.
+
+    Returns the in-memory visual index plus the rows, so queries can be cut
+    from known videos.
+    """
+    rng = np.random.default_rng(seed)
+    finger.create_tables(db_path)
+    conn = finger.get_connection(db_path)
+    index = finger.HammingIndex()
+    videos = {}
+    for start in range(0, stored_hashes, hashes_per_video):
+        n = min(hashes_per_video, stored_hashes - start)
+        visual = [(int(h), f * 12) for f, h in enumerate(rng.integers(0, 2 ** 64, size=n, dtype=np.uint64))]
+        chroma = [(rng.bytes(20), f * 0.5) for f in range(n)]
+        frames = np.sort(rng.integers(0, n * 20, size=n))
+        landmarks = [(int(h), int(f)) for h, f in zip(rng.integers(0, 2 ** 26, size=n), frames)]
+        vid = finger.store_fingerprints(conn, f"synthetic/{start}", f"synthetic {start}", n * 0.5,
+                                        {"chroma": chroma, "landmark": landmarks}, visual)
+        index.add_many(vid, visual)
+        videos[vid] = (chroma, landmarks, visual)
+    conn.close()
+    return index, videos
+
+def make_query(videos, rng, length=40, bit_flips=3):
+    """A clip of one stored video: exact chroma, shifted landmarks, lightly corrupted pHashes."""
+    vid = rng.choice(list(videos))
+    chroma, landmarks, visual = videos[vid]
+    start = rng.randrange(0, max(1, len(visual) - length))
+    q_visual = []
+    for h, f in visual[start:start + length]:
+        for bit in rng.sample(range(64), bit_flips):
+            h ^= 1 << bit
+        q_visual.append((h, f))
+    first_frame = landmarks[start][1]
+    q_landmarks = [(h, f - first_frame) for h, f in landmarks[start:start + length * 5]]
+    return vid, ({"chroma": chroma[start:start + length], "landmark": q_landmarks},
+                 length * 0.5, q_visual)
+
+def bench_query_scaling(workdir, catalog_sizes, queries, seed=0):
+    results = []
+    rng = random.Random(seed)
+    saved_index = finger.VISUAL_INDEX
+    try:
+        for size in catalog_sizes:
+            db_path = os.path.join(workdir, f"catalog_{size}.db")
+            (index, videos), build_seconds = timed(build_synthetic_catalog, db_path, size)
+            finger.VISUAL_INDEX = index
+            conn = finger.get_connection(db_path)
+            latencies, correct = [], 0
+            for _ in range(queries):
+                vid, fingerprints = make_query(videos, rng)
+                result, spent = timed(finger.score_query, conn, fingerprints)
+                latencies.append(spent * 1000)
+                correct += result.get("matched_video_id") == vid
+            conn.close()
+            results.append({
+                "stored_hashes_per_table": size,
+                "videos": len(videos),
+                "build_seconds": build_seconds,
+                "db_bytes": os.path.getsize(db_path),
+                "query_p50_ms": percentile(latencies, 50),
+                "query_p99_ms": percentile(latencies, 99),
+                "query_accuracy": correct / queries if queries else None,
+                "peak_rss_mb": peak_rss_mb(),
+            })
+            os.unlink(db_path)
+    finally:
+        finger.VISUAL_INDEX = saved_index
+    return results
+
+# ================= RECALL UNDER TRANSFORMS =================
+def bench_recall(workdir, db_path, media, seconds, clip_seconds=10, clips_per_title=5):
+    """Query transformed copies of every ingested title; recall = fraction matched to the original.
+
+    Degraded audio clips are cut at clips_per_title offsets of every title
+    and must match on landmark votes alone (chroma hashes don't survive
+    the noise), so their vote percentiles are reported next to LANDMARK_MIN_VOTES.
+    """
+    conn = finger.get_connection(db_path)
+    saved_index = finger.VISUAL_INDEX
+    finger.VISUAL_INDEX = finger.load_visual_index(conn, finger.HammingIndex())
+    transforms = {
+        "video_reencode_q30": lambda i, dst: make_video(dst + ".avi", seconds, seed=i, quality=30),
+        "video_crop_10pct": lambda i, dst: make_video(dst + ".avi", seconds, seed=i, crop=0.1),
+    }
+    recall = {}
+    try:
+        for name, transform in transforms.items():
+            hits = 0
+            for i, item in enumerate(media):
+                path = transform(i, os.path.join(workdir, f"{name}_{i}"))
+                fingerprints = ({}, 0.0, finger.video_fingerprint(path))
+                hits += finger.score_query(conn, fingerprints).get("matched_video_id") == item["video_id"]
+            recall[name] = hits / len(media) if media else None
+
+        hits, votes = 0, []
+        starts = np.linspace(0, max(seconds - clip_seconds, 0), clips_per_title)
+        for i, item in enumerate(media):
+            for j, start in enumerate(starts):
+                dst = os.path.join(workdir, f"audio_clip_degraded_{i}_{j}")
+                path = degrade_audio(excerpt_audio(item["audio"], dst + "_clip.wav", start, clip_seconds),
+                                     dst + ".wav", seed=i * clips_per_title + j)
+                result = finger.score_query(conn, (finger.audio_fingerprint(path)[0], 0.0, []))
+                matched = result.get("matched_video_id") == item["video_id"]
+                hits += matched
+                votes.append(result.get("landmark_matches", 0) if matched else 0)
+        recall["audio_clip_degraded"] = hits / len(votes) if votes else None
+        recall["audio_clip_degraded_clips"] = len(votes)
+        recall["audio_clip_degraded_votes_p10"] = percentile(votes, 10)
+        recall["audio_clip_degraded_votes_p50"] = percentile(votes, 50)
+        recall["landmark_min_votes"] = finger.LANDMARK_MIN_VOTES
+    finally:
+        finger.VISUAL_INDEX = saved_index
+        conn.close()
+    return recall
+
+# ================= CLI =================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the anti-piracy fingerprinting service")
+    parser.add_argument("--titles", type=int, default=4, help="synthetic titles to ingest")
+    parser.add_argument("--clips-per-title", type=int, default=5,
+                        help="degraded audio clips cut from each title for the recall run")
+    parser.add_argument("--seconds", type=float, default=60, help="length of each synthetic title")
+    parser.add_argument("--catalog-sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="stored hashes per table for the query-latency runs (up to 1e6)")
+    parser.add_argument("--queries", type=int, default=100, help="queries per catalog size")
+    parser.add_argument("--workdir", help="keep generated media here instead of a temp dir")
+    parser.add_argument("--output", help="write the JSON report here as well as to stdout")
+    args = parser.parse_args(argv)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bench_finger_")
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        report = {
+            "timestamp": time.time(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "config": {
+                "audio_modes": list(finger.AUDIO_FINGERPRINT_MODES),
+                "visual_matcher": finger.VISUAL_MATCHER,
+                "visual_radius": finger.VISUAL_HAMMING_RADIUS,
+                "video_workers": finger.VIDEO_WORKERS,
+            },
+        }
+        report["ingest"], db_path, media = bench_ingest(workdir, args.titles, args.seconds)
+        report["recall"] = bench_recall(workdir, db_path, media, args.seconds,
+                                        clips_per_title=args.clips_per_title)
+        report["query_scaling"] = bench_query_scaling(workdir, args.catalog_sizes, args.queries)
+        report["peak_rss_mb"] = peak_rss_mb()
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    return report
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+"""Load benchmark for the subtitle service (test.py).
+
+Runs the real FastAPI app in-process against local fakes of Sarvam and
+Gemini (fakes.py), so no API keys or network are needed; Whisper still
+runs for real, so language detection and transcription costs are genuine.
+Synthetic audio (and, with --video-share, video muxed by ffmpeg) is
+generated up front and POSTed to /generate-subtitles at each concurrency
+level:
+
+    python bench_subtitles.py --output bench_subtitles.json
+    python bench_subtitles.py --concurrency 1 4 16 --route whisper --gemini-failure-rate 0.1
+
+Reports requests/sec, request latency percentiles, per-stage latency
+percentiles (from the Server-Timing header), cache outcomes and peak RSS
+per level, as one JSON document.
+"""
+import os
+import sys
+import json
+import time
+import wave
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import itertools
+import subprocess
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+# ================= HELPERS =================
+def peak_rss_mb():
+    """Peak resident set size of this process so far (ru_maxrss is KiB on Linux, bytes on macOS)."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else None
+
+def parse_server_timing(header):
+    """{stage: seconds} from a Server-Timing header value."""
+    stages = {}
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur" and name:
+                stages[name] = float(value) / 1000
+    return stages
+
+# ================= SYNTHETIC MEDIA =================
+def make_audio(path, seconds, seed, sr=SAMPLE_RATE):
+    """Speech-like bursts: harmonic tones with a moving pitch, separated by pauses.
+
+    Deterministic for a seed, and every seed gives different bytes, so each
+    fixture is a result-cache miss unless it is reused on purpose.
+    """
+    rng = np.random.default_rng(seed)
+    pieces = []
+    total = 0
+    while total < seconds * sr:
+        burst = int(sr * rng.uniform(0.8, 3.0))
+        t = np.arange(burst) / sr
+        pitch = rng.uniform(90, 250) * (1 + 0.1 * np.sin(2 * np.pi * rng.uniform(1, 4) * t))
+        phase = 2 * np.pi * np.cumsum(pitch) / sr
+        voice = sum(np.sin(k * phase) / k for k in range(1, 6)) * np.hanning(burst) * 0.2
+        pause = np.zeros(int(sr * rng.uniform(0.2, 0.8)))
+        pieces += [voice, pause]
+        total += burst + len(pause)
+    y = np.concatenate(pieces)[:int(seconds * sr)] + 0.002 * rng.standard_normal(int(seconds * sr))
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sr)
+        wav.writeframes((np.clip(y, -1, 1) * 32767).astype("<i2").tobytes())
+    return path
+
+def make_video(path, seconds, seed):
+    """An MP4 of ffmpeg's test pattern with a make_audio() soundtrack."""
+    audio_path = make_audio(path + ".wav", seconds, seed)
+    try:
+        subprocess.run(
+            ["ffmpeg", "-nostdin", "-loglevel", "error", "-y",
+             "-f", "lavfi", "-i", f"testsrc=size=320x240:rate=25:duration={seconds}",
+             "-i", audio_path, "-shortest", "-c:v", "libx264", "-preset", "ultrafast",
+             "-c:a", "aac", path],
+            check=True
+        )
+    finally:
+        os.unlink(audio_path)
+    return path
+
+def make_fixtures(workdir, count, seconds, video_share):
+    """count distinct fixtures; every round(1 / video_share)-th one is a video."""
+    every = round(1 / video_share) if video_share else 0
+    fixtures = []
+    for i in range(count):
+        if every and i % every == every - 1:
+            fixtures.append(make_video(os.path.join(workdir, f"fixture{i}.mp4"), seconds, seed=i))
+        else:
+            fixtures.append(make_audio(os.path.join(workdir, f"fixture{i}.wav"), seconds, seed=i))
+    return fixtures
+
+# ================= SERVICE =================
+def load_service(workdir, args):
+    """Import test.py with its caches in workdir and the fakes wired in."""
+    os.environ.update({
+        "SARVAM_FAKE": "1",
+        "GEMINI_FAKE": "1",
+        "RESULT_CACHE_PATH": os.path.join(workdir, "result_cache.db") if args.caches else "",
+        "TRANSLATION_CACHE_PATH": os.path.join(workdir, "translation_cache.db") if args.caches else "",
+        "SUBTITLE_JOB_DB": os.path.join(workdir, "subtitle_jobs.db"),
+        "SUBTITLE_JOB_DIR": os.path.join(workdir, "subtitle_jobs"),
+    })
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import test
+    from fakes import FakeSarvamAI, FakeGenerativeModel
+
+    test.SARVAM_BATCHER.client_factory = lambda: FakeSarvamAI(
+        latency=args.sarvam_latency, latency_per_file=args.sarvam_latency_per_file,
+        failure_rate=args.sarvam_failure_rate)
+    # One shared model, as a real client would be; its rng is seeded once
+    model = FakeGenerativeModel(
+        latency=args.gemini_latency, latency_per_cue=args.gemini_latency_per_cue,
+        failure_rate=args.gemini_failure_rate, malformed_rate=args.gemini_malformed_rate)
+    test.create_translation_model = lambda: model
+
+    if args.route != "auto":
+        # Run real detection for its cost, then send every request down one engine
+        detect_language = test.detect_language
+        forced = "hi" if args.route == "sarvam" else "en"
+        def detect_and_force(audio):
+            detect_language(audio)
+            return forced
+        test.detect_language = detect_and_force
+    return test, model
+
+# ================= LOAD =================
+def post_subtitles(client, path, target_language):
+    started = time.perf_counter()
+    with open(path, "rb") as f:
+        response = client.post("/generate-subtitles", files={"file": (os.path.basename(path), f)},
+                               data={"target_language": target_language})
+    return {
+        "status": response.status_code,
+        "seconds": time.perf_counter() - started,
+        "stages": parse_server_timing(response.headers.get("server-timing", "")),
+        "cache": response.headers.get("x-cache", ""),
+    }
+
+def run_level(client, paths, concurrency, target_language):
+    """Upload every path from concurrency threads; returns the level's report."""
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        started = time.perf_counter()
+        results = list(pool.map(lambda path: post_subtitles(client, path, target_language), paths))
+        wall = time.perf_counter() - started
+
+    ok = [r for r in results if r["status"] == 200]
+    latencies = [r["seconds"] * 1000 for r in ok]
+    stage_samples = defaultdict(list)
+    for result in ok:
+        for stage, seconds in result["stages"].items():
+            if stage != "total":
+                stage_samples[stage].append(seconds * 1000)
+    # X-Cache is "outcome" for one language, "lang=outcome,..." for several
+    cache = Counter(outcome.rpartition("=")[2]
+                    for result in ok for outcome in result["cache"].split(",") if outcome)
+    return {
+        "concurrency": concurrency,
+        "requests": len(results),
+        "succeeded": len(ok),
+        "status_counts": dict(Counter(str(r["status"]) for r in results)),
+        "wall_seconds": wall,
+        "requests_per_second": len(ok) / wall if wall else None,
+        "latency_p50_ms": percentile(latencies, 50),
+        "latency_p95_ms": percentile(latencies, 95),
+        "latency_p99_ms": percentile(latencies, 99),
+        "stages_ms": {
+            stage: {"requests": len(samples), "p50": percentile(samples, 50),
+                    "p95": percentile(samples, 95), "p99": percentile(samples, 99)}
+            for stage, samples in sorted(stage_samples.items())
+        },
+        "cache_outcomes": dict(cache),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+# ================= CLI =================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the subtitle service with local Sarvam/Gemini fakes")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8],
+                        help="concurrent clients, one run per level")
+    parser.add_argument("--requests-per-client", type=int, default=4, help="requests per client at each level")
+    parser.add_argument("--seconds", type=float, default=30, help="length of each synthetic fixture")
+    parser.add_argument("--video-share", type=float, default=0.0,
+                        help="fraction of fixtures that are MP4 video (needs ffmpeg with libx264)")
+    parser.add_argument("--distinct", type=int, default=0,
+                        help="distinct fixtures, reused round-robin (default: a new one per request, all cache misses)")
+    parser.add_argument("--no-caches", dest="caches", action="store_false",
+                        help="disable the result and translation caches")
+    parser.add_argument("--target-language", default="fr", help="comma-separated target languages per request")
+    parser.add_argument("--route", choices=["sarvam", "whisper", "auto"], default="sarvam",
+                        help="force the transcription engine (auto: trust language detection)")
+    parser.add_argument("--sarvam-latency", type=float, default=1.0, help="fake Sarvam seconds per batch job")
+    parser.add_argument("--sarvam-latency-per-file", type=float, default=0.1, help="fake Sarvam seconds per file")
+    parser.add_argument("--sarvam-failure-rate", type=float, default=0.0, help="share of fake Sarvam jobs that fail")
+    parser.add_argument("--gemini-latency", type=float, default=0.5, help="fake Gemini seconds per request")
+    parser.add_argument("--gemini-latency-per-cue", type=float, default=0.01, help="fake Gemini seconds per cue")
+    parser.add_argument("--gemini-failure-rate", type=float, default=0.0, help="share of fake Gemini calls that raise")
+    parser.add_argument("--gemini-malformed-rate", type=float, default=0.0,
+                        help="share of fake Gemini replies missing a cue")
+    parser.add_argument("--workdir", help="keep fixtures and caches here instead of a temp dir")
+    parser.add_argument("--output", help="write the JSON report here as well as to stdout")
+    args = parser.parse_args(argv)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bench_subtitles_")
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        test, model = load_service(workdir, args)
+        from fastapi.testclient import TestClient
+
+        needed = sum(level * args.requests_per_client for level in args.concurrency)
+        fixtures = make_fixtures(workdir, args.distinct or needed, args.seconds, args.video_share)
+        # Levels draw from one round-robin sequence, so without --distinct no upload repeats
+        sequence = itertools.cycle(fixtures)
+        report = {
+            "timestamp": time.time(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "config": {
+                "route": args.route,
+                "fixture_seconds": args.seconds,
+                "distinct_fixtures": len(fixtures),
+                "video_share": args.video_share,
+                "target_language": args.target_language,
+                "caches": args.caches,
+                "whisper_detect_model": test.WHISPER_DETECT_MODEL,
+                "whisper_transcribe_model": test.WHISPER_TRANSCRIBE_MODEL,
+                "whisper_parallel_workers": test.WHISPER_PARALLEL_WORKERS,
+                "sarvam_batch_window_seconds": test.SARVAM_BATCH_WINDOW_SECONDS,
+                "translation_concurrency": test.TRANSLATION_CONCURRENCY,
+                "sarvam": {"latency": args.sarvam_latency, "latency_per_file": args.sarvam_latency_per_file,
+                           "failure_rate": args.sarvam_failure_rate},
+                "gemini": {"latency": args.gemini_latency, "latency_per_cue": args.gemini_latency_per_cue,
+                           "failure_rate": args.gemini_failure_rate, "malformed_rate": args.gemini_malformed_rate},
+            },
+            "levels": [],
+        }
+        with TestClient(test.app) as client:
+            for level in args.concurrency:
+                paths = [next(sequence) for _ in range(level * args.requests_per_client)]
+                report["levels"].append(run_level(client, paths, level, args.target_language))
+        report["sarvam_batches"] = test.SARVAM_BATCHER.stats()
+        report["gemini_calls"] = model.calls
+        report["peak_rss_mb"] = peak_rss_mb()
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    return report
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Local stand-ins for the external speech and translation APIs.
+
+They follow the parts of the SDK interfaces that test.py uses, so the
+subtitle service can run, be tested and be benchmarked without API keys.
+"""
+import os
+import json
+import time
+import wave
+import random
+import threading
+
+class FakeSarvamJob:
+    """Batch speech-to-text job: one JSON transcript per uploaded file"""
+
+    def __init__(self, client):
+        self.client = client
+        self.file_paths = []
+        self.failed = False
+
+    def upload_files(self, file_paths):
+        self.file_paths.extend(file_paths)
+
+    def start(self):
+        self.failed = self.client.rng.random() < self.client.failure_rate
+
+    def wait_until_complete(self):
+        time.sleep(self.client.latency + self.client.latency_per_file * len(self.file_paths))
+
+    def is_failed(self):
+        return self.failed
+
+    def download_outputs(self, output_dir):
+        for path in self.file_paths:
+            name = os.path.basename(path)
+            with open(os.path.join(output_dir, f"{name}.json"), "w", encoding="utf-8") as f:
+                json.dump(fake_transcript(audio_seconds(path), name), f)
+
+class FakeSarvamJobs:
+    def __init__(self, client):
+        self.client = client
+
+    def create_job(self, **kwargs):
+        self.client.jobs_created += 1
+        return FakeSarvamJob(self.client)
+
+class FakeSarvamAI:
+    """Drop-in for sarvamai.SarvamAI with configurable job latency and failure rate"""
+
+    def __init__(self, api_subscription_key=None, latency=1.0, latency_per_file=0.1, failure_rate=0.0, seed=0):
+        self.latency = latency
+        self.latency_per_file = latency_per_file
+        self.failure_rate = failure_rate
+        self.rng = random.Random(seed)
+        self.jobs_created = 0
+        self.speech_to_text_translate_job = FakeSarvamJobs(self)
+
+def audio_seconds(path, default=30.0):
+    """Duration of a WAV file; other formats are assumed to last `default` seconds"""
+    try:
+        with wave.open(path, "rb") as wav:
+            return wav.getnframes() / wav.getframerate()
+    except (wave.Error, EOFError, OSError):
+        return default
+
+def fake_transcript(seconds, label="audio", cue_seconds=2.5):
+    """Sarvam-shaped diarized transcript with one cue every cue_seconds"""
+    entries = []
+    start = 0.0
+    while start < seconds:
+        end = min(start + cue_seconds, seconds)
+        entries.append({
+            "start_time_seconds": start,
+            "end_time_seconds": end,
+            "transcript": f"{label} line {len(entries) + 1}",
+            "speaker_id": "0"
+        })
+        start = end
+    return {"diarized_transcript": {"entries": entries}}
+
+class FakeGeminiResponse:
+    def __init__(self, text):
+        self.text = text
+
+class FakeGenerativeModel:
+    """
+    Drop-in for genai.GenerativeModel as used for translation: answers the
+    per-cue JSON prompt with one record per cue after a configurable delay.
+    failure_rate is the share of calls that raise; malformed_rate the share
+    of replies missing one record, which exercises the partial retry.
+    """
+
+    def __init__(self, model_name="fake", latency=0.5, latency_per_cue=0.01, failure_rate=0.0,
+                 malformed_rate=0.0, seed=0, **kwargs):
+        self.latency = latency
+        self.latency_per_cue = latency_per_cue
+        self.failure_rate = failure_rate
+        self.malformed_rate = malformed_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+
+    def generate_content(self, prompt):
+        records = json.loads(prompt.rsplit("SUBTITLES TO TRANSLATE:\n", 1)[1])
+        with self.lock:
+            self.calls += 1
+            fail = self.rng.random() < self.failure_rate
+            malformed = self.rng.random() < self.malformed_rate
+        time.sleep(self.latency + self.latency_per_cue * len(records))
+        if fail:
+            raise RuntimeError("Fake Gemini request failed")
+        if malformed and records:
+            records = records[:-1]
+        return FakeGeminiResponse(json.dumps(
+            [{"id": record["id"], "emotion": "neutral", "text": f"~{record['text']}"} for record in records],
+            ensure_ascii=False
+        ))
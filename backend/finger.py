@@ -5,18 +5,141 @@ import numpy as np
 import hashlib
 import sqlite3
 import tempfile
-from fastapi import FastAPI, UploadFile, File, Form
+import argparse
+import asyncio
+import multiprocessing
+import time
+import uuid
+import json
+import shutil
+import itertools
+import math
+import contextlib
+import threading
+import queue
+from array import array
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from PIL import Image
+from scipy.ndimage import maximum_filter
 import imagehash
+import soundfile as sf
+import audioread
+import soxr
+from uploads import stream_upload, add_upload_limit
+from metrics import Metrics, instrument_app, profile_requested, call_profiled
+try:
+    import fcntl
+except ImportError:  # Windows: shard file locks are unavailable
+    fcntl = None
 
 # ================= CONFIGURATION =================
 DB_PATH = "anti_piracy.db"
 UPLOAD_DIR = "uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
+# Per-video memory-mapped uint64 pHash arrays used by the "scan" matcher
+FINGERPRINT_DIR = "fingerprints"
+
+# Bumped when the hash tables change layout; see migrate_compact_hashes()
+SCHEMA_VERSION = 1
 
 # Similarity threshold: min fraction of hashes that must match to trigger a hit
 SIMILARITY_THRESHOLD = 0.15  
+# Landmark hits aligned on one time offset needed to trigger a hit on their
+# own; chance collisions rarely line up more than once or twice
+LANDMARK_MIN_VOTES = 5
+
+# SQLite tuning applied to every connection. WAL lets /query read while an
+# ingest is writing, and synchronous=NORMAL only fsyncs at checkpoints
+# instead of on every commit.
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-65536",      # 64 MiB page cache
+    "PRAGMA mmap_size=268435456",    # 256 MiB memory-mapped I/O
+)
+
+# Visual pHashes (64-bit) within this Hamming distance count as the same frame,
+# so re-encodes, rescales and watermarks still match. 0 = exact match only.
+VISUAL_HAMMING_RADIUS = 8
+# Substrings per hash in the near-neighbour index (64 / blocks bits each)
+VISUAL_INDEX_BLOCKS = 4
+# How radius > 0 visual lookups run:
+#   "index" - in-memory multi-index hash table, sub-linear per query frame
+#   "scan"  - vectorized XOR + popcount over memory-mapped per-video arrays
+VISUAL_MATCHER = "index"
+# Query x stored hash pairs compared per NumPy block in "scan" mode; temp
+# memory is a few dozen bytes per pair, so about 32 MB per block
+VISUAL_SCAN_BLOCK = 1 << 20
+
+# Audio fingerprints computed at ingest and matched at query time:
+#   "chroma"   - SHA1 of pooled chroma + spectral contrast per 0.5 s window,
+#                exact match only
+#   "landmark" - spectrogram peak pairs hashed as (f1, f2, dt) with their
+#                anchor frame, matched by voting on a consistent time offset;
+#                survives resampling, gain changes and lossy codecs
+AUDIO_FINGERPRINT_MODES = ("chroma", "landmark")
+AUDIO_SR = 22050
+# One STFT (~93 ms frames, ~23 ms hop) feeds every audio fingerprint mode
+AUDIO_N_FFT = 2048
+AUDIO_HOP = 512
+CHROMA_WINDOW = AUDIO_SR // 2   # samples pooled into one chroma hash
+# Decode the file in blocks instead of holding the whole signal in memory.
+# Use the same setting at ingest and query time: chroma digests hash raw
+# floats, and the streaming resampler is not bit-identical to librosa.load.
+AUDIO_STREAMING = False
+# Block size: the smallest span aligned to both CHROMA_WINDOW and AUDIO_HOP
+# (~256 s), so blocks see exactly the frames and windows a single pass would
+AUDIO_BLOCK_SAMPLES = math.lcm(CHROMA_WINDOW, AUDIO_HOP)
+
+# Landmark extraction
+LANDMARK_PEAK_SIZE = (21, 21)   # local-max neighbourhood (bins, frames)
+LANDMARK_MIN_DB = -60.0         # relative to the loudest bin of the block
+LANDMARK_MIN_PROMINENCE_DB = 20.0  # above the median bin of the peak's frame, so noise-floor maxima drop out
+LANDMARK_PEAKS_PER_SECOND = 30  # most prominent peaks kept per second
+LANDMARK_FAN_OUT = 5            # pairs per anchor peak
+LANDMARK_MAX_DT = 63            # target zone: frames ahead of the anchor; dt is packed into 6 bits
+LANDMARK_MAX_DF = 128           # target zone: bins above or below the anchor
+
+# Visual sampling: one frame per VIDEO_SAMPLE_INTERVAL seconds, downscaled so
+# its longest side is VIDEO_MAX_SIDE before colour conversion and hashing
+VIDEO_SAMPLE_INTERVAL = 0.5
+VIDEO_MAX_SIDE = 256
+# Frame step when the container reports no frame rate (the old frame_skip)
+VIDEO_FALLBACK_STEP = 15
+# Videos longer than this are split into time ranges hashed in a process pool
+VIDEO_MIN_SEGMENT_SECONDS = 120
+VIDEO_WORKERS = os.cpu_count() or 1
+
+# Background jobs: fingerprinting runs in JOB_WORKERS processes. Beyond
+# JOB_MAX_PENDING queued + running jobs new submissions get a 503.
+JOB_WORKERS = os.cpu_count() or 1
+JOB_MAX_PENDING = 4 * JOB_WORKERS
+JOB_RETENTION_SECONDS = 3600    # finished jobs are forgotten after this
+
+# Streaming queries fingerprint the upload in growing time segments (first
+# segment, then x growth, capped) and stop once the best candidate has at
+# least QUERY_STREAM_MIN_SCORE hits and QUERY_STREAM_MARGIN times the
+# runner-up's score.
+QUERY_STREAM_FIRST_SECONDS = 10
+QUERY_STREAM_GROWTH = 2.0
+QUERY_STREAM_MAX_SEGMENT_SECONDS = 120
+QUERY_STREAM_MIN_SCORE = 20
+QUERY_STREAM_MARGIN = 3.0
+
+# Sharded catalog: with SHARD_COUNT > 0 the hash tables are range-partitioned
+# by 16-bit hash prefix into SHARD_COUNT SQLite files under SHARD_DIR, each
+# owned by its own worker process. The videos table stays in DB_PATH.
+SHARD_COUNT = 0
+SHARD_DIR = "shards"
+SHARD_COPY_BATCH = 50000        # rows per batch when resharding
+
+# File types picked up by the bulk-import CLI
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.webm', '.flv', '.wmv', '.m4v')
 
 # ================= FASTAPI SETUP =================
 app = FastAPI(
@@ -25,6 +148,8 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Registered before CORS so CORS wraps it and its early 413 still carries the CORS headers
+add_upload_limit(app)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -32,192 +157,1603 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+METRICS = Metrics("fingerprint")
+instrument_app(app, METRICS)
 
 # ================= DATABASE =================
-def create_tables():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS videos (
+def get_connection(db_path=DB_PATH):
+    """Open a SQLite connection with the tuned pragmas applied."""
+    conn = sqlite3.connect(db_path, timeout=30)
+    for pragma in SQLITE_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+def create_hash_tables(conn):
+    # pHashes are stored as the signed 64-bit view of the uint64 value and
+    # audio digests as raw bytes, about a third of the size of the hex text.
+    conn.execute('''CREATE TABLE IF NOT EXISTS audio_hashes (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
-        file_path TEXT,
-        title TEXT,
-        duration REAL
+        video_id INTEGER,
+        hash BLOB,
+        time REAL,
+        FOREIGN KEY(video_id) REFERENCES videos(id)
     )''')
-    c.execute('''CREATE TABLE IF NOT EXISTS audio_hashes (
+    conn.execute('''CREATE TABLE IF NOT EXISTS visual_hashes (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         video_id INTEGER,
-        hash TEXT,
-        time REAL,
+        hash INTEGER,
+        frame INTEGER,
         FOREIGN KEY(video_id) REFERENCES videos(id)
     )''')
-    c.execute('''CREATE TABLE IF NOT EXISTS visual_hashes (
+    conn.execute('''CREATE TABLE IF NOT EXISTS audio_landmarks (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         video_id INTEGER,
-        hash TEXT,
+        hash INTEGER,
         frame INTEGER,
         FOREIGN KEY(video_id) REFERENCES videos(id)
     )''')
+
+def create_hash_indexes(conn):
+    # Lookups go by hash; per-video scans (index rebuilds, deletes) by video_id
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_audio_hashes_hash ON audio_hashes(hash)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_audio_hashes_video ON audio_hashes(video_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_visual_hashes_hash ON visual_hashes(hash)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_visual_hashes_video ON visual_hashes(video_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_audio_landmarks_hash ON audio_landmarks(hash)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_audio_landmarks_video ON audio_landmarks(video_id)")
+
+def migrate_compact_hashes(conn):
+    """Convert a version-0 database (hex TEXT hashes) to the compact layout."""
+    conn.execute("BEGIN")
+    try:
+        conn.execute("ALTER TABLE audio_hashes RENAME TO audio_hashes_text")
+        conn.execute("ALTER TABLE visual_hashes RENAME TO visual_hashes_text")
+        create_hash_tables(conn)
+        conn.executemany(
+            "INSERT INTO audio_hashes (id, video_id, hash, time) VALUES (?, ?, ?, ?)",
+            ((i, vid, bytes.fromhex(h), t) for i, vid, h, t in
+             conn.execute("SELECT id, video_id, hash, time FROM audio_hashes_text").fetchall()))
+        conn.executemany(
+            "INSERT INTO visual_hashes (id, video_id, hash, frame) VALUES (?, ?, ?, ?)",
+            ((i, vid, to_sqlite_int(int(h, 16)), f) for i, vid, h, f in
+             conn.execute("SELECT id, video_id, hash, frame FROM visual_hashes_text").fetchall()))
+        # Dropping the old tables also drops their indexes, freeing the names
+        conn.execute("DROP TABLE audio_hashes_text")
+        conn.execute("DROP TABLE visual_hashes_text")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+def create_tables(db_path=DB_PATH):
+    conn = get_connection(db_path)
+    c = conn.cursor()
+    c.execute('''CREATE TABLE IF NOT EXISTS videos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        file_path TEXT,
+        title TEXT,
+        duration REAL
+    )''')
+    version = c.execute("PRAGMA user_version").fetchone()[0]
+    existing = c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'audio_hashes'").fetchone()
+    if existing and version < 1:
+        migrate_compact_hashes(conn)
+    create_hash_tables(conn)
+    create_hash_indexes(conn)
+    c.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
     conn.commit()
     conn.close()
 
 @app.on_event("startup")
 def startup_event():
     create_tables()
+    if SHARD_COUNT:
+        open_shards()
+    conn = get_connection()
+    try:
+        if SHARDS is not None:
+            pass  # each shard worker indexes its own visual hashes
+        elif VISUAL_MATCHER == "scan":
+            VISUAL_CATALOG.load(conn)
+        else:
+            load_visual_index(conn, VISUAL_INDEX)
+    finally:
+        conn.close()
+    JOB_QUEUE.start()
+
+@app.on_event("shutdown")
+def shutdown_event():
+    JOB_QUEUE.stop()
+    if SHARDS is not None:
+        SHARDS.close()
+
+def active_visual_matcher():
+    if SHARDS is not None:
+        return None  # shard workers update their own indexes on insert
+    return VISUAL_CATALOG if VISUAL_MATCHER == "scan" else VISUAL_INDEX
+
+# SQLite integers are signed, pHashes are unsigned 64-bit
+def to_sqlite_int(h):
+    return h - (1 << 64) if h >= (1 << 63) else h
+
+def from_sqlite_int(v):
+    return v + (1 << 64) if v < 0 else v
 
 # ================= HELPER FUNCTIONS =================
-def insert_video(file_path, title, duration):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("INSERT INTO videos (file_path, title, duration) VALUES (?, ?, ?)",
-              (file_path, title, duration))
-    vid = c.lastrowid
-    conn.commit()
-    conn.close()
+# All writers take an open connection and leave committing to the caller,
+# so a whole video lands in one transaction (one fsync) instead of one per hash.
+def insert_video(conn, file_path, title, duration):
+    c = conn.execute("INSERT INTO videos (file_path, title, duration) VALUES (?, ?, ?)",
+                     (file_path, title, duration))
+    return c.lastrowid
+
+def insert_audio_hashes(conn, video_id, hashes):
+    conn.executemany("INSERT INTO audio_hashes (video_id, hash, time) VALUES (?, ?, ?)",
+                     ((video_id, h, t) for h, t in hashes))
+
+def insert_audio_landmarks(conn, video_id, landmarks):
+    conn.executemany("INSERT INTO audio_landmarks (video_id, hash, frame) VALUES (?, ?, ?)",
+                     ((video_id, h, f) for h, f in landmarks))
+
+def insert_visual_hashes(conn, video_id, hashes):
+    conn.executemany("INSERT INTO visual_hashes (video_id, hash, frame) VALUES (?, ?, ?)",
+                     ((video_id, to_sqlite_int(h), f) for h, f in hashes))
+
+def store_fingerprints(conn, file_path, title, duration, audio, visual_hashes):
+    """Write a video row and all of its hashes in a single transaction.
+
+    audio is the {mode: hashes} dict returned by audio_fingerprint().
+    When sharded, the video row commits first and each shard then commits
+    its share of the hashes in its own transaction.
+    """
+    if SHARDS is not None:
+        with conn:
+            vid = insert_video(conn, file_path, title, duration)
+        SHARDS.insert(vid, audio, visual_hashes)
+        return vid
+    with conn:
+        vid = insert_video(conn, file_path, title, duration)
+        insert_audio_hashes(conn, vid, audio.get("chroma", ()))
+        insert_audio_landmarks(conn, vid, audio.get("landmark", ()))
+        insert_visual_hashes(conn, vid, visual_hashes)
     return vid
 
-def insert_audio_hash(video_id, h, t):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("INSERT INTO audio_hashes (video_id, hash, time) VALUES (?, ?, ?)",
-              (video_id, str(h), t))
-    conn.commit()
-    conn.close()
+def fingerprint_file(file_path, video_workers=VIDEO_WORKERS):
+    """All fingerprints of a media file: (audio, duration, visual_hashes)."""
+    audio, duration = audio_fingerprint(file_path)
+    visual_hashes = video_fingerprint(file_path, workers=video_workers)
+    return audio, duration, visual_hashes
 
-def insert_visual_hash(video_id, h, f):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("INSERT INTO visual_hashes (video_id, hash, frame) VALUES (?, ?, ?)",
-              (video_id, str(h), f))
-    conn.commit()
-    conn.close()
+def ingest_file(conn, file_path, title, index=None):
+    """Fingerprint a media file and store it. Returns the /ingest summary."""
+    return store_ingest(conn, file_path, title, fingerprint_file(file_path), index)
+
+def store_ingest(conn, file_path, title, fingerprints, index=None):
+    """Store fingerprint_file() output. Returns the /ingest summary.
+
+    If a visual matcher (HammingIndex or VisualCatalog) is given it is
+    updated once the transaction commits.
+    """
+    audio, duration, visual_hashes = fingerprints
+    vid = store_fingerprints(conn, file_path, title, duration, audio, visual_hashes)
+    if index is not None:
+        index.add_many(vid, visual_hashes)
+    return {"status": "success", "video_id": vid, "duration": duration,
+            "audio_hashes": len(audio.get("chroma", ())),
+            "audio_landmarks": len(audio.get("landmark", ())),
+            "visual_hashes": len(visual_hashes)}
 
 # ================= AUDIO FINGERPRINT =================
-def audio_fingerprint(file_path):
-    """Robust audio fingerprint using chroma + spectral contrast features."""
-    y, sr = librosa.load(file_path, sr=22050)
-    hop = sr // 2  # half-second windows
-    duration = librosa.get_duration(y=y, sr=sr)
-    hashes = []
-    for i in range(0, len(y), hop):
-        seg = y[i:i+hop]
-        if len(seg) == 0 or np.mean(np.abs(seg)) < 0.01:
-            continue
-        chroma = librosa.feature.chroma_stft(y=seg, sr=sr)
-        spec = librosa.feature.spectral_contrast(y=seg, sr=sr)
-        feature_vec = np.concatenate([np.mean(chroma, axis=1), np.mean(spec, axis=1)])
-        h = hashlib.sha1(feature_vec.tobytes()).hexdigest()
-        hashes.append((h, i / sr))
-    return hashes, duration
+def read_audio_stream(file_path):
+    """Yield mono AUDIO_SR float32 chunks without decoding the whole file.
+
+    soundfile handles WAV/FLAC/OGG/MP3; anything else (video containers)
+    is decoded through audioread. Both feed one streaming resampler.
+    """
+    try:
+        f = sf.SoundFile(file_path)
+    except Exception:
+        f = None
+    if f is not None:
+        with f:
+            resampler = soxr.ResampleStream(f.samplerate, AUDIO_SR, 1, dtype="float32")
+            for block in f.blocks(blocksize=f.samplerate * 10, dtype="float32", always_2d=True):
+                yield resampler.resample_chunk(block.mean(axis=1))
+            yield resampler.resample_chunk(np.zeros(0, dtype=np.float32), last=True)
+        return
+    with audioread.audio_open(file_path) as f:
+        resampler = soxr.ResampleStream(f.samplerate, AUDIO_SR, 1, dtype="float32")
+        for buf in f:
+            pcm = np.frombuffer(buf, dtype="<i2").astype(np.float32) / 32768.0
+            yield resampler.resample_chunk(pcm.reshape(-1, f.channels).mean(axis=1))
+        yield resampler.resample_chunk(np.zeros(0, dtype=np.float32), last=True)
+
+def decode_audio_chunks(file_path, streaming=AUDIO_STREAMING):
+    """The whole file as mono AUDIO_SR chunks: streamed, or one librosa.load() array."""
+    if streaming:
+        yield from read_audio_stream(file_path)
+    else:
+        yield librosa.load(file_path, sr=AUDIO_SR)[0]
+
+def iter_audio_blocks(chunks, first_sample=0, sizes=None):
+    """Yield (start_sample, block, padded, is_last) for consecutive blocks of the stream.
+
+    Blocks are AUDIO_BLOCK_SAMPLES long, or take their lengths in turn from
+    sizes; the last may be short. padded carries AUDIO_N_FFT // 2 samples
+    of the neighbouring blocks (zeros at the file edges), so an uncentered
+    STFT over it reproduces exactly the centered frames a single STFT over
+    the whole signal would have there. Only those samples are read ahead of
+    a block. first_sample offsets the reported positions when decoding a
+    file excerpt.
+    """
+    half = AUDIO_N_FFT // 2
+    chunks = iter(chunks)
+    sizes = iter(sizes) if sizes is not None else itertools.repeat(AUDIO_BLOCK_SAMPLES)
+    buf = np.zeros(0, dtype=np.float32)
+    head = np.zeros(half, dtype=np.float32)
+    start = first_sample
+    exhausted = False
+    for size in sizes:
+        while not exhausted and len(buf) < size + half:
+            chunk = next(chunks, None)
+            if chunk is None:
+                exhausted = True
+            else:
+                buf = np.concatenate([buf, chunk])
+        if not len(buf):
+            return
+        current = buf[:size]
+        is_last = exhausted and len(buf) <= size
+        tail = buf[size:size + half]
+        tail = np.pad(tail, (0, half - len(tail)))
+        yield start, current, np.concatenate([head, current, tail]), is_last
+        if is_last:
+            return
+        head = np.concatenate([head, current])[-half:]
+        start += len(current)
+        buf = buf[size:]
+
+def chroma_hashes(block, S, start, sr=AUDIO_SR):
+    """SHA1 digests of chroma + spectral contrast per half-second window.
+
+    Features come from the shared spectrogram S and are mean-pooled per
+    window with np.add.reduceat instead of a per-window STFT. start is the
+    block's first sample and must be a multiple of AUDIO_HOP. Windows are
+    numbered from the start of the file; one cut by the block edge is
+    pooled from the part inside the block.
+    """
+    if len(block) == 0:
+        return []
+    first = start // CHROMA_WINDOW
+    n_windows = (start + len(block) - 1) // CHROMA_WINDOW - first + 1
+    # Silence gate, same rule as before: mean |y| of the window below 0.01
+    edges = np.maximum(np.arange(first, first + n_windows) * CHROMA_WINDOW - start, 0)
+    lengths = np.diff(np.append(edges, len(block)))
+    loud = np.add.reduceat(np.abs(block), edges) / lengths >= 0.01
+
+    chroma = librosa.feature.chroma_stft(S=S ** 2, sr=sr, n_fft=AUDIO_N_FFT,
+                                         hop_length=AUDIO_HOP, tuning=0.0)
+    contrast = librosa.feature.spectral_contrast(S=S, sr=sr, n_fft=AUDIO_N_FFT,
+                                                 hop_length=AUDIO_HOP)
+    features = np.concatenate([chroma, contrast]).T  # (frames, 19)
+    # Frame j is centred on sample start + j * AUDIO_HOP
+    window_of_frame = (start + np.arange(features.shape[0]) * AUDIO_HOP) // CHROMA_WINDOW - first
+    bounds = np.searchsorted(window_of_frame, np.arange(n_windows))
+    # Only a final window shorter than one hop can be left without a frame
+    n_pooled = int(np.count_nonzero(bounds < len(features)))
+    bounds = bounds[:n_pooled]
+    counts = np.diff(np.append(bounds, len(features)))
+    pooled = (np.add.reduceat(features, bounds, axis=0) / counts[:, None]).astype(np.float32)
+    loud[n_pooled:] = False
+
+    return [(hashlib.sha1(pooled[w].tobytes()).digest(), (first + w) * CHROMA_WINDOW / sr)
+            for w in np.flatnonzero(loud)]
+
+def landmark_hashes(S, start, sr=AUDIO_SR):
+    """Constellation fingerprint: pairs of spectrogram peaks.
+
+    Peaks are local maxima that stand LANDMARK_MIN_PROMINENCE_DB above the
+    median of their frame; the most prominent LANDMARK_PEAKS_PER_SECOND per
+    second are kept. Each peak is paired with the first LANDMARK_FAN_OUT
+    peaks in its target zone (1..LANDMARK_MAX_DT frames later, within
+    LANDMARK_MAX_DF bins), so a peak gained or lost to noise only affects
+    the pairs in one zone. The pair is packed as f1 (10 bits) | f2 (10 bits)
+    | dt (6 bits) and stored with the anchor frame. Only peak positions are
+    kept, so gain, resampling and codec noise leave most of the hashes
+    intact. Peaks are picked per block; in streaming mode pairs spanning a
+    block boundary are not formed.
+    """
+    S = S[:1024]
+    if S.size == 0:
+        return []
+    S_db = librosa.amplitude_to_db(S, ref=np.max)
+    prominence = S_db - np.median(S_db, axis=0, keepdims=True)
+    peaks = ((maximum_filter(S_db, size=LANDMARK_PEAK_SIZE) == S_db) & (S_db > LANDMARK_MIN_DB)
+             & (prominence >= LANDMARK_MIN_PROMINENCE_DB))
+    freqs, frames = np.nonzero(peaks)
+    strength = prominence[freqs, frames]
+    frames = frames + start // AUDIO_HOP
+    # Keep the most prominent LANDMARK_PEAKS_PER_SECOND peaks in each second
+    second = frames // max(1, round(sr / AUDIO_HOP))
+    order = np.lexsort((-strength, second))
+    start_of_group = np.searchsorted(second[order], second[order])
+    keep = order[np.arange(len(order)) - start_of_group < LANDMARK_PEAKS_PER_SECOND]
+    # Then order by (frame, bin) for pairing
+    keep = keep[np.lexsort((freqs[keep], frames[keep]))]
+    frames = frames[keep].astype(np.int64)
+    freqs = freqs[keep].astype(np.int64)
+    n = len(frames)
+    if n < 2:
+        return []
+    # Candidates for anchor i are peaks i+1 .. i+reach, the last one within LANDMARK_MAX_DT
+    reach = int((np.searchsorted(frames, frames + LANDMARK_MAX_DT, side="right") - np.arange(n) - 1).max())
+    if reach < 1:
+        return []
+    candidates = np.arange(n)[:, None] + np.arange(1, reach + 1)[None, :]
+    in_range = candidates < n
+    candidates = np.minimum(candidates, n - 1)
+    dt = frames[candidates] - frames[:, None]
+    df = freqs[candidates] - freqs[:, None]
+    in_zone = in_range & (dt >= 1) & (dt <= LANDMARK_MAX_DT) & (np.abs(df) <= LANDMARK_MAX_DF)
+    in_zone &= np.cumsum(in_zone, axis=1) <= LANDMARK_FAN_OUT
+    anchors, k = np.nonzero(in_zone)
+    h = (freqs[anchors] << 16) | (freqs[candidates[anchors, k]] << 6) | dt[anchors, k]
+    return list(zip(h.tolist(), frames[anchors].tolist()))
+
+def landmark_frame_to_seconds(frame):
+    return frame * AUDIO_HOP / AUDIO_SR
+
+def audio_fingerprint(file_path, modes=AUDIO_FINGERPRINT_MODES, streaming=AUDIO_STREAMING,
+                      offset=0.0, duration=None):
+    """Compute each requested fingerprint mode from one STFT pass.
+
+    With streaming=True the file is decoded block by block, so peak memory
+    is bounded by AUDIO_BLOCK_SAMPLES rather than the file length. offset /
+    duration (seconds) fingerprint an excerpt; keep offset on a multiple of
+    AUDIO_HOP / AUDIO_SR so landmark frames line up with whole-file ones.
+    Returns ({mode: [(hash, time), ...]}, end time). Chroma times are in
+    seconds, landmark times in STFT frames, both from the start of the file.
+    """
+    first_sample = int(round(offset * AUDIO_SR))
+    if offset or duration is not None:
+        y, _ = librosa.load(file_path, sr=AUDIO_SR, offset=offset, duration=duration)
+        chunks = [y]
+    else:
+        chunks = decode_audio_chunks(file_path, streaming)
+    fingerprints = {mode: [] for mode in modes}
+    total = first_sample
+    for start, block, padded, is_last in iter_audio_blocks(chunks, first_sample):
+        for mode, hashes in block_fingerprints(start, block, padded, is_last, modes).items():
+            fingerprints[mode].extend(hashes)
+        total = start + len(block)
+    return fingerprints, total / AUDIO_SR
+
+def block_fingerprints(start, block, padded, is_last, modes=AUDIO_FINGERPRINT_MODES):
+    """{mode: hashes} of one block from iter_audio_blocks()."""
+    S = np.abs(librosa.stft(padded, n_fft=AUDIO_N_FFT, hop_length=AUDIO_HOP, center=False))
+    if not is_last:
+        S = S[:, :len(block) // AUDIO_HOP]  # the last frame belongs to the next block
+    fingerprints = {}
+    if "chroma" in modes:
+        fingerprints["chroma"] = chroma_hashes(block, S, start)
+    if "landmark" in modes:
+        fingerprints["landmark"] = landmark_hashes(S, start)
+    return fingerprints
 
 # ================= VISUAL FINGERPRINT =================
-def video_fingerprint(file_path, frame_skip=15):
-    """Perceptual hash (phash) of frames at interval frame_skip."""
+def phash_frame(frame):
+    """64-bit pHash of a BGR frame as an unsigned int."""
+    height, width = frame.shape[:2]
+    scale = VIDEO_MAX_SIDE / max(height, width)
+    if scale < 1:
+        frame = cv2.resize(frame, (max(1, round(width * scale)), max(1, round(height * scale))),
+                           interpolation=cv2.INTER_AREA)
+    pil_frame = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    return int(str(imagehash.phash(pil_frame)), 16)
+
+def _sampled_frame(k, step):
+    return int(round(k * step))
+
+def hash_frame_range(file_path, step, first, last=None):
+    """pHash sample frames first..last-1 (last=None: to end of file).
+
+    Sample k is frame round(k * step). The capture seeks once to the first
+    sample and then grab()s past the frames in between, which skips the
+    colour conversion and copy that read() does for every frame. A seek is
+    only frame-exact on well-indexed streams; where it lands short (e.g. on
+    the previous keyframe) the grabs walk forward to the sample, and where
+    it overshoots the capture starts again from the first frame.
+    """
     cap = cv2.VideoCapture(file_path)
-    frame_idx = 0
+    pos = _sampled_frame(first, step)
+    if pos:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, pos)
+        landed = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
+        if not 0 <= landed <= pos:
+            cap.release()
+            cap = cv2.VideoCapture(file_path)
+            landed = 0
+        pos = landed
     hashes = []
-    while True:
+    k = first
+    while last is None or k < last:
+        target = _sampled_frame(k, step)
+        while pos < target and cap.grab():
+            pos += 1
+        if pos < target:
+            break
         ret, frame = cap.read()
         if not ret:
             break
-        if frame_idx % frame_skip == 0:
-            pil_frame = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
-            h = str(imagehash.phash(pil_frame))
-            hashes.append((h, frame_idx))
-        frame_idx += 1
+        pos += 1
+        hashes.append((phash_frame(frame), target))
+        k += 1
     cap.release()
     return hashes
 
+def video_sampling(file_path, interval=VIDEO_SAMPLE_INTERVAL):
+    """(fps, frame_count, step) where sample k is frame round(k * step)."""
+    cap = cv2.VideoCapture(file_path)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    step = interval * fps if fps > 0 else VIDEO_FALLBACK_STEP
+    return fps, frame_count, step
+
+def video_fingerprint(file_path, interval=VIDEO_SAMPLE_INTERVAL, workers=VIDEO_WORKERS):
+    """Perceptual hashes of one frame every `interval` seconds, as (uint64, frame index).
+
+    Long videos are cut into contiguous sample ranges hashed in a process
+    pool; the ranges are concatenated in order, so the output is the same as
+    with workers=1.
+    """
+    fps, frame_count, step = video_sampling(file_path, interval)
+
+    samples = -(-frame_count // step) if frame_count > 0 else 0
+    min_samples = max(1, int(VIDEO_MIN_SEGMENT_SECONDS / interval))
+    n_ranges = int(min(workers, samples // min_samples)) if samples else 1
+    if n_ranges <= 1:
+        return hash_frame_range(file_path, step, 0)
+
+    # The last range is open-ended in case the reported frame count is short
+    bounds = [int(samples * i / n_ranges) for i in range(n_ranges)] + [None]
+    with ProcessPoolExecutor(max_workers=n_ranges) as pool:
+        parts = pool.map(hash_frame_range, [file_path] * n_ranges, [step] * n_ranges,
+                         bounds[:-1], bounds[1:])
+        return [h for part in parts for h in part]
+
+# ================= VISUAL NEAR-NEIGHBOUR INDEX =================
+class HammingIndex:
+    """Multi-index hash table over 64-bit pHashes.
+
+    Each hash is split into `blocks` substrings with one lookup table per
+    substring. Two hashes within Hamming distance r must agree to within
+    r // blocks bits on at least one substring (pigeonhole), so a search only
+    probes the buckets near each query substring and verifies those
+    candidates, instead of comparing against every stored hash.
+    """
+
+    def __init__(self, blocks=VISUAL_INDEX_BLOCKS):
+        if 64 % blocks:
+            raise ValueError("blocks must divide 64")
+        self.blocks = blocks
+        self.bits = 64 // blocks
+        self.mask = (1 << self.bits) - 1
+        self.tables = [defaultdict(list) for _ in range(blocks)]
+        # Parallel typed arrays (8 bytes per field); position is the entry id
+        self.hashes = array("Q")
+        self.videos = array("q")
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def _split(self, h):
+        return [(h >> (b * self.bits)) & self.mask for b in range(self.blocks)]
+
+    def _probes(self, key, radius):
+        """All substrings within `radius` bits of key."""
+        yield key
+        for r in range(1, radius + 1):
+            for positions in itertools.combinations(range(self.bits), r):
+                flipped = key
+                for p in positions:
+                    flipped ^= 1 << p
+                yield flipped
+
+    def add(self, video_id, h):
+        with self.lock:
+            entry = len(self.hashes)
+            self.hashes.append(h)
+            self.videos.append(video_id)
+            for table, key in zip(self.tables, self._split(h)):
+                table[key].append(entry)
+
+    def add_many(self, video_id, hashes):
+        for h, _ in hashes:
+            self.add(video_id, h)
+
+    def search(self, h, radius=VISUAL_HAMMING_RADIUS):
+        """Return {video_id: distance} of the closest stored hash per video within radius."""
+        sub_radius = radius // self.blocks
+        seen = set()
+        found = {}
+        with self.lock:
+            for table, key in zip(self.tables, self._split(h)):
+                for probe in self._probes(key, sub_radius):
+                    for entry in table.get(probe, ()):
+                        if entry in seen:
+                            continue
+                        seen.add(entry)
+                        stored, vid = self.hashes[entry], self.videos[entry]
+                        dist = bin(stored ^ h).count("1")
+                        if dist <= radius and dist < found.get(vid, radius + 1):
+                            found[vid] = dist
+        return found
+
+    def match_counts(self, query_hashes, radius=VISUAL_HAMMING_RADIUS):
+        """Return {video_id: number of query frames with a stored frame within radius}."""
+        scores = {}
+        for h, _ in query_hashes:
+            for vid in self.search(h, radius):
+                scores[vid] = scores.get(vid, 0) + 1
+        return scores
+
+def load_visual_index(conn, index):
+    """Fill index from the visual_hashes table (run once at startup).
+
+    Videos loaded with the bulk-import CLI while the API is running are
+    picked up on the next restart.
+    """
+    for vid, h in conn.execute("SELECT video_id, hash FROM visual_hashes"):
+        index.add(vid, from_sqlite_int(h))
+    return index
+
+# Byte-wise popcount table for NumPy builds without np.bitwise_count (< 2.0)
+_POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+def popcount64(x):
+    """Per-element set-bit count of a uint64 array."""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(x)
+    x = np.ascontiguousarray(x)
+    return _POPCOUNT8[x.view(np.uint8)].reshape(x.shape + (8,)).sum(axis=-1)
+
+class VisualCatalog:
+    """Per-video uint64 pHash arrays, memory-mapped from FINGERPRINT_DIR.
+
+    Matching XORs every query hash against each video's array in blocks and
+    counts bits, so the scan runs at memory bandwidth with no per-row SQL and
+    only the pages actually touched stay resident.
+    """
+
+    def __init__(self, directory=FINGERPRINT_DIR):
+        self.directory = directory
+        self.arrays = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return sum(len(a) for a in self.arrays.values())
+
+    def path(self, video_id):
+        return os.path.join(self.directory, f"visual_{video_id}.npy")
+
+    def add_many(self, video_id, hashes):
+        if not hashes:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        np.save(self.path(video_id), np.array([h for h, _ in hashes], dtype=np.uint64))
+        with self.lock:
+            self.arrays[video_id] = np.load(self.path(video_id), mmap_mode="r")
+
+    def load(self, conn):
+        """Map every video's array, rebuilding missing files from visual_hashes."""
+        os.makedirs(self.directory, exist_ok=True)
+        for (vid,) in conn.execute("SELECT id FROM videos").fetchall():
+            if not os.path.exists(self.path(vid)):
+                rows = conn.execute("SELECT hash, frame FROM visual_hashes WHERE video_id = ? ORDER BY id",
+                                    (vid,)).fetchall()
+                self.add_many(vid, [(from_sqlite_int(h), f) for h, f in rows])
+            else:
+                with self.lock:
+                    self.arrays[vid] = np.load(self.path(vid), mmap_mode="r")
+        return self
+
+    def match_counts(self, query_hashes, radius=VISUAL_HAMMING_RADIUS):
+        """Return {video_id: number of query frames with a stored frame within radius}."""
+        if not query_hashes:
+            return {}
+        q = np.array([h for h, _ in query_hashes], dtype=np.uint64)
+        # Tile both sides so a block never holds more than VISUAL_SCAN_BLOCK pairs,
+        # however long the query is
+        q_step = min(len(q), max(1, math.isqrt(VISUAL_SCAN_BLOCK)))
+        s_step = max(1, VISUAL_SCAN_BLOCK // q_step)
+        with self.lock:
+            arrays = list(self.arrays.items())
+        scores = {}
+        for vid, stored in arrays:
+            hit = np.zeros(len(q), dtype=bool)
+            for q_start in range(0, len(q), q_step):
+                q_block = q[q_start:q_start + q_step, None]
+                for start in range(0, len(stored), s_step):
+                    block = stored[start:start + s_step]
+                    hit[q_start:q_start + q_step] |= (popcount64(q_block ^ block[None, :]) <= radius).any(axis=1)
+            hits = int(hit.sum())
+            if hits:
+                scores[vid] = hits
+        return scores
+
+VISUAL_INDEX = HammingIndex()
+VISUAL_CATALOG = VisualCatalog()
+
+# ================= SHARDED CATALOG =================
+# Shard workers keep one connection and one HammingIndex per shard file,
+# keyed by path so the same functions serve process and thread executors.
+_SHARD_STATE = {}
+
+def _shard_init(path):
+    conn = get_connection(path)
+    create_hash_tables(conn)
+    create_hash_indexes(conn)
+    conn.commit()
+    _SHARD_STATE[path] = {"conn": conn, "index": load_visual_index(conn, HammingIndex())}
+
+def _shard_insert(path, audio_rows, landmark_rows, visual_rows):
+    state = _SHARD_STATE[path]
+    conn = state["conn"]
+    with conn:
+        conn.executemany("INSERT INTO audio_hashes (video_id, hash, time) VALUES (?, ?, ?)", audio_rows)
+        conn.executemany("INSERT INTO audio_landmarks (video_id, hash, frame) VALUES (?, ?, ?)", landmark_rows)
+        conn.executemany("INSERT INTO visual_hashes (video_id, hash, frame) VALUES (?, ?, ?)",
+                         ((vid, to_sqlite_int(h), f) for vid, h, f in visual_rows))
+    for vid, h, _ in visual_rows:
+        state["index"].add(vid, h)
+
+def _shard_count_matches(path, table, keys):
+    return count_hash_matches(_SHARD_STATE[path]["conn"], table, keys)
+
+def _shard_landmark_offsets(path, landmarks):
+    return count_landmark_offsets(_SHARD_STATE[path]["conn"], landmarks)
+
+def _shard_visual_near(path, hashes, radius):
+    """{query position: [video ids]} for stored hashes within radius in this shard."""
+    index = _SHARD_STATE[path]["index"]
+    found = {}
+    for i, h in enumerate(hashes):
+        vids = index.search(h, radius)
+        if vids:
+            found[i] = list(vids)
+    return found
+
+def _shard_close(path):
+    state = _SHARD_STATE.pop(path, None)
+    if state:
+        state["conn"].close()
+
+def shard_prefix(table, h):
+    """16-bit routing prefix of a stored hash."""
+    if table == "audio_hashes":
+        return int.from_bytes(h[:2], "big")
+    if table == "audio_landmarks":
+        return (h >> 10) & 0xFFFF  # bits 10-25 of the ~26-bit landmark hash
+    return h >> 48
+
+def lock_file(path, shared=False, wait=True):
+    """Open path and flock() it; the lock lasts until the returned fd is closed.
+
+    Returns None when wait is False and another process holds a conflicting
+    lock. Without fcntl the fd is returned unlocked.
+    """
+    fd = os.open(path, os.O_RDWR | os.O_CREAT)
+    if fcntl is None:
+        return fd
+    try:
+        fcntl.flock(fd, (fcntl.LOCK_SH if shared else fcntl.LOCK_EX) | (0 if wait else fcntl.LOCK_NB))
+    except BlockingIOError:
+        os.close(fd)
+        return None
+    return fd
+
+class ShardedCatalog:
+    """Hash tables range-partitioned by 16-bit prefix over N shard files.
+
+    Shard i owns prefixes [i * 65536 / N, (i + 1) * 65536 / N), so a query
+    only visits the shards its hashes route to, and those lookups run in
+    parallel on the shard workers. Near-neighbour visual lookups cannot use
+    the prefix and go to every shard. Layout lives in
+    <directory>/manifest.json; each resharding writes a new generation
+    directory and switches over once it is complete.
+
+    Several processes may open the same directory (the server and the
+    `reshard` command): writers take <directory>/write.lock, each process
+    holds a shared lock on the generation it reads from, and a process that
+    finds the manifest changed switches to the new generation. An old
+    generation is deleted by the last process to let go of it. Without
+    fcntl (Windows) the file locks do nothing, so stop the server before
+    resharding from the command line.
+    """
+
+    def __init__(self, directory=SHARD_DIR, processes=True):
+        self.directory = directory
+        self.processes = processes
+        self.lock = threading.RLock()  # guards the switch between generations
+        self.write_lock = threading.Lock()
+        self.executors = []
+        self.paths = []
+        self.generation = 0
+        self.generation_lock = None
+        self.manifest_stamp = None
+
+    @property
+    def count(self):
+        return len(self.paths)
+
+    def _manifest_path(self):
+        return os.path.join(self.directory, "manifest.json")
+
+    def _generation_dir(self, generation):
+        return os.path.join(self.directory, f"gen{generation}")
+
+    def _generation_paths(self, generation, count):
+        gen_dir = self._generation_dir(generation)
+        return [os.path.join(gen_dir, f"shard_{i}.db") for i in range(count)]
+
+    def _start(self, paths):
+        executors = []
+        for path in paths:
+            if self.processes:
+                executor = ProcessPoolExecutor(max_workers=1, initializer=_shard_init, initargs=(path,),
+                                               mp_context=multiprocessing.get_context("spawn"))
+            else:
+                executor = ThreadPoolExecutor(max_workers=1, initializer=_shard_init, initargs=(path,))
+            executors.append(executor)
+        return executors
+
+    def _stop(self, executors, paths):
+        for executor, path in zip(executors, paths):
+            if not self.processes:
+                executor.submit(_shard_close, path).result()
+            executor.shutdown(wait=True)
+
+    @contextlib.contextmanager
+    def _writing(self):
+        """Exclusive against inserts and reshards in this and every other process."""
+        with self.write_lock:
+            fd = lock_file(os.path.join(self.directory, "write.lock"))
+            try:
+                yield
+            finally:
+                os.close(fd)
+
+    def open(self, count, source_db=None):
+        """Start the shard workers, creating or resharding to `count` shards as needed.
+
+        With source_db, hashes still held in its unsharded tables are moved
+        into the shards the first time the catalog is opened.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        with self._writing():
+            if os.path.exists(self._manifest_path()):
+                self._load_manifest()
+            else:
+                paths = self._build_generation(1, count, [source_db] if source_db else [])
+                self._switch(1, paths)
+                self._write_manifest()
+                if source_db:
+                    clear_hash_tables(source_db)
+            self._clean_generations(self.generation)
+        if count != self.count:
+            self.reshard(count)
+        return self
+
+    def close(self):
+        with self._writing():
+            with self.lock:
+                executors, paths, fd = self.executors, self.paths, self.generation_lock
+                self.executors, self.generation_lock = [], None
+            self._stop(executors, paths)
+            if fd is not None:
+                os.close(fd)
+            with open(self._manifest_path()) as f:
+                self._clean_generations(json.load(f)["generation"])
+
+    def _write_manifest(self):
+        tmp = self._manifest_path() + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"shards": self.count, "generation": self.generation}, f)
+        os.replace(tmp, self._manifest_path())
+        self.manifest_stamp = self._manifest_stamp()
+
+    def _manifest_stamp(self):
+        st = os.stat(self._manifest_path())
+        return st.st_ino, st.st_mtime_ns
+
+    def _manifest_changed(self):
+        return self._manifest_stamp() != self.manifest_stamp
+
+    def _load_manifest(self):
+        """Switch to the generation named in the manifest. Caller holds _writing()."""
+        stamp = self._manifest_stamp()
+        with open(self._manifest_path()) as f:
+            manifest = json.load(f)
+        if manifest["generation"] != self.generation:
+            self._switch(manifest["generation"],
+                         self._generation_paths(manifest["generation"], manifest["shards"]))
+        self.manifest_stamp = stamp
+
+    def refresh(self):
+        """Pick up a resharding done by another process."""
+        if self._manifest_changed():
+            with self._writing():
+                self._load_manifest()
+
+    def _switch(self, generation, paths):
+        """Move queries over to `paths` and let go of the previous generation."""
+        fd = lock_file(os.path.join(self._generation_dir(generation), "in_use.lock"), shared=True)
+        executors = self._start(paths)
+        with self.lock:
+            old = self.generation, self.executors, self.paths, self.generation_lock
+            self.generation, self.executors, self.paths, self.generation_lock = generation, executors, paths, fd
+        old_generation, old_executors, old_paths, old_fd = old
+        # Queries already submitted to the old workers finish before they stop
+        self._stop(old_executors, old_paths)
+        if old_fd is not None:
+            os.close(old_fd)
+        if old_generation:
+            self._retire(old_generation)
+
+    def _retire(self, generation):
+        """Delete a generation directory unless another process still reads from it."""
+        gen_dir = self._generation_dir(generation)
+        fd = lock_file(os.path.join(gen_dir, "in_use.lock"), wait=False)
+        if fd is not None:
+            shutil.rmtree(gen_dir, ignore_errors=True)
+            os.close(fd)
+
+    def _clean_generations(self, keep):
+        """Remove generations left behind by processes that exited or crashed mid-reshard."""
+        for name in os.listdir(self.directory):
+            if name.startswith("gen") and name[3:].isdigit() and int(name[3:]) != keep:
+                self._retire(int(name[3:]))
+
+    def _build_generation(self, generation, count, sources):
+        """Create `count` shard files and copy every hash row of `sources` into them."""
+        paths = self._generation_paths(generation, count)
+        shutil.rmtree(os.path.dirname(paths[0]), ignore_errors=True)
+        os.makedirs(os.path.dirname(paths[0]))
+        targets = [get_connection(p) for p in paths]
+        try:
+            for conn in targets:
+                create_hash_tables(conn)
+            tables = (("audio_hashes", "video_id, hash, time"),
+                      ("audio_landmarks", "video_id, hash, frame"),
+                      ("visual_hashes", "video_id, hash, frame"))
+            for source in sources:
+                src = get_connection(source)
+                try:
+                    for table, columns in tables:
+                        cursor = src.execute(f"SELECT {columns} FROM {table}")
+                        while True:
+                            rows = cursor.fetchmany(SHARD_COPY_BATCH)
+                            if not rows:
+                                break
+                            routed = defaultdict(list)
+                            for row in rows:
+                                h = from_sqlite_int(row[1]) if table == "visual_hashes" else row[1]
+                                routed[shard_prefix(table, h) * count >> 16].append(row)
+                            for i, part in routed.items():
+                                targets[i].executemany(
+                                    f"INSERT INTO {table} ({columns}) VALUES (?, ?, ?)", part)
+                            for conn in targets:
+                                conn.commit()
+                finally:
+                    src.close()
+            # Index after the bulk copy: much faster than maintaining it row by row
+            for conn in targets:
+                create_hash_indexes(conn)
+                conn.commit()
+        finally:
+            for conn in targets:
+                conn.close()
+        return paths
+
+    def reshard(self, count):
+        """Redistribute every hash into `count` shards and switch over.
+
+        Inserts from every process wait while the copy runs; queries keep
+        using the old shards until the new generation is complete. Other
+        processes switch on their next query or insert.
+        """
+        with self._writing():
+            if self._manifest_changed():
+                self._load_manifest()
+            generation = self.generation + 1
+            # Read-only copy of the shard files: queries carry on meanwhile
+            new_paths = self._build_generation(generation, count, self.paths)
+            self._switch(generation, new_paths)
+            self._write_manifest()
+
+    def _scatter(self, fn, per_shard):
+        """Run fn(path, *args) on each shard in per_shard(count) -> {shard: args} concurrently.
+
+        Routing and submission happen against one layout, so a switch to a
+        new generation cannot land between them.
+        """
+        with self.lock:
+            futures = [self.executors[i].submit(fn, self.paths[i], *args)
+                       for i, args in per_shard(self.count).items()]
+        return [f.result() for f in futures]
+
+    @staticmethod
+    def _route(table, items, count, key=lambda item: item):
+        routed = defaultdict(list)
+        for item in items:
+            routed[shard_prefix(table, key(item)) * count >> 16].append(item)
+        return routed
+
+    def insert(self, video_id, audio, visual_hashes):
+        audio_rows = [(video_id, h, t) for h, t in audio.get("chroma", ())]
+        landmark_rows = [(video_id, h, f) for h, f in audio.get("landmark", ())]
+        visual_rows = [(video_id, h, f) for h, f in visual_hashes]
+
+        def per_shard(count):
+            routed = [self._route("audio_hashes", audio_rows, count, key=lambda r: r[1]),
+                      self._route("audio_landmarks", landmark_rows, count, key=lambda r: r[1]),
+                      self._route("visual_hashes", visual_rows, count, key=lambda r: r[1])]
+            shards = set().union(*routed)
+            return {i: tuple(part.get(i, []) for part in routed) for i in shards}
+
+        with self._writing():  # keeps a reshard from starting half way through
+            if self._manifest_changed():
+                self._load_manifest()
+            self._scatter(_shard_insert, per_shard)
+
+    def count_matches(self, table, keys):
+        self.refresh()
+        # visual keys arrive in their signed SQLite form; route on the unsigned hash
+        key = from_sqlite_int if table == "visual_hashes" else (lambda k: k)
+        scores = {}
+        for part in self._scatter(_shard_count_matches, lambda count: {
+                i: (table, ks) for i, ks in self._route(table, keys, count, key).items()}):
+            for vid, hits in part.items():
+                scores[vid] = scores.get(vid, 0) + hits
+        return scores
+
+    def landmark_offset_votes(self, landmarks):
+        self.refresh()
+        votes = {}
+        for part in self._scatter(_shard_landmark_offsets, lambda count: {
+                i: (lms,) for i, lms in self._route("audio_landmarks", landmarks, count,
+                                                    key=lambda lm: lm[0]).items()}):
+            for key, n in part.items():
+                votes[key] = votes.get(key, 0) + n
+        return votes
+
+    def visual_match_counts(self, query_hashes, radius=VISUAL_HAMMING_RADIUS):
+        """Same counting as HammingIndex.match_counts, gathered over every shard."""
+        if not query_hashes:
+            return {}
+        if radius == 0:
+            return self.count_matches("visual_hashes", [to_sqlite_int(h) for h, _ in query_hashes])
+        self.refresh()
+        hashes = [h for h, _ in query_hashes]
+        matched = defaultdict(set)
+        for part in self._scatter(_shard_visual_near,
+                                  lambda count: {i: (hashes, radius) for i in range(count)}):
+            for i, vids in part.items():
+                matched[i].update(vids)
+        scores = {}
+        for vids in matched.values():
+            for vid in vids:
+                scores[vid] = scores.get(vid, 0) + 1
+        return scores
+
+def clear_hash_tables(db_path):
+    """Empty the unsharded hash tables once their rows live in the shards."""
+    conn = get_connection(db_path)
+    try:
+        with conn:
+            for table in ("audio_hashes", "audio_landmarks", "visual_hashes"):
+                conn.execute(f"DELETE FROM {table}")
+    finally:
+        conn.close()
+
+def open_shards(db_path=DB_PATH, directory=SHARD_DIR, count=SHARD_COUNT, processes=True):
+    """Start the sharded catalog and route all hash reads and writes through it."""
+    global SHARDS
+    SHARDS = ShardedCatalog(directory, processes).open(count, source_db=db_path)
+    return SHARDS
+
+SHARDS = None
+
 # ================= QUERY FUNCTIONS =================
-def query_audio_hashes(query_hashes):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    results = []
-    for h, t in query_hashes:
-        c.execute("SELECT video_id FROM audio_hashes WHERE hash = ?", (str(h),))
-        matches = c.fetchall()
-        for m in matches:
-            results.append(m[0])
-    conn.close()
-    return results
+def count_hash_matches(conn, table, keys):
+    """Return {video_id: hits} for stored-form hash keys against table in one indexed join.
 
-def query_visual_hashes(query_hashes):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    results = []
-    for h, f in query_hashes:
-        c.execute("SELECT video_id FROM visual_hashes WHERE hash = ?", (str(h),))
-        matches = c.fetchall()
-        for m in matches:
-            results.append(m[0])
-    conn.close()
-    return results
+    The query hashes are staged in a temp table so SQLite does a single join
+    over idx_<table>_hash instead of one SELECT per hash. CROSS JOIN pins the
+    (small) query table as the outer loop; otherwise the planner may pick a
+    full scan of the catalog to satisfy the GROUP BY. Every (query hash,
+    stored row) pair counts as a hit, as before.
+    """
+    if not keys:
+        return {}
+    with conn:
+        # Untyped column: holds BLOB audio digests and INTEGER pHashes alike
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS query_hashes (hash)")
+        conn.execute("DELETE FROM query_hashes")
+        conn.executemany("INSERT INTO query_hashes (hash) VALUES (?)", ((k,) for k in keys))
+        rows = conn.execute(f"""SELECT t.video_id, COUNT(*)
+                                FROM query_hashes q CROSS JOIN {table} t ON t.hash = q.hash
+                                GROUP BY t.video_id""").fetchall()
+        conn.execute("DELETE FROM query_hashes")
+    return dict(rows)
 
-# ================= FASTAPI ENDPOINTS =================
-@app.post("/ingest")
-async def ingest_video(file: UploadFile = File(...), title: str = Form("Untitled")):
-    """Ingest a new video and store audio-visual fingerprints."""
-    temp_path = os.path.join(UPLOAD_DIR, file.filename)
-    with open(temp_path, "wb") as f:
-        f.write(await file.read())
+def query_audio_hashes(conn, query_hashes):
+    if SHARDS is not None:
+        return SHARDS.count_matches("audio_hashes", [h for h, _ in query_hashes])
+    return count_hash_matches(conn, "audio_hashes", [h for h, _ in query_hashes])
 
-    audio_hashes, duration = audio_fingerprint(temp_path)
-    visual_hashes = video_fingerprint(temp_path)
-    vid = insert_video(temp_path, title, duration)
+def landmark_offset_votes(conn, landmarks):
+    """Time-offset voting: return {(video_id, offset_frames): votes}.
 
-    for h, t in audio_hashes:
-        insert_audio_hash(vid, h, t)
-    for h, f in visual_hashes:
-        insert_visual_hash(vid, h, f)
+    Every hash hit votes for (stored frame - query frame). A true match
+    piles its votes onto one offset while chance collisions scatter.
+    """
+    if SHARDS is not None:
+        return SHARDS.landmark_offset_votes(landmarks)
+    return count_landmark_offsets(conn, landmarks)
 
-    return {"status": "success", "video_id": vid, "duration": duration,
-            "audio_hashes": len(audio_hashes), "visual_hashes": len(visual_hashes)}
+def count_landmark_offsets(conn, landmarks):
+    """landmark_offset_votes() against the audio_landmarks table of conn."""
+    if not landmarks:
+        return {}
+    with conn:
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS query_landmarks (hash INTEGER, frame INTEGER)")
+        conn.execute("DELETE FROM query_landmarks")
+        conn.executemany("INSERT INTO query_landmarks (hash, frame) VALUES (?, ?)", landmarks)
+        rows = conn.execute("""SELECT t.video_id, t.frame - q.frame AS delta, COUNT(*)
+                               FROM query_landmarks q CROSS JOIN audio_landmarks t ON t.hash = q.hash
+                               GROUP BY t.video_id, delta""").fetchall()
+        conn.execute("DELETE FROM query_landmarks")
+    return {(vid, delta): votes for vid, delta, votes in rows}
 
-@app.post("/query")
-async def query_video(file: UploadFile = File(...)):
-    """Query uploaded video for pirated content."""
-    temp_path = os.path.join(tempfile.gettempdir(), file.filename)
-    with open(temp_path, "wb") as f:
-        f.write(await file.read())
+def best_landmark_offsets(votes):
+    """Reduce offset votes to {video_id: (votes, offset_frames)} of the best bin per video.
 
-    q_audio, _ = audio_fingerprint(temp_path)
-    q_visual = video_fingerprint(temp_path)
+    That bin is both the score and where the clip sits in the video.
+    """
+    best = {}
+    for (vid, delta), n in votes.items():
+        if n > best.get(vid, (0, 0))[0]:
+            best[vid] = (n, delta)
+    return best
 
-    audio_matches = query_audio_hashes(q_audio) if q_audio else []
-    visual_matches = query_visual_hashes(q_visual) if q_visual else []
+def query_audio_landmarks(conn, landmarks):
+    return best_landmark_offsets(landmark_offset_votes(conn, landmarks))
 
-    if not audio_matches and not visual_matches:
-        return {"match_found": False, "message": "No match found."}
+def query_visual_hashes(conn, query_hashes, radius=VISUAL_HAMMING_RADIUS):
+    """Return {video_id: hits} for visual hashes.
+
+    With radius > 0 the VISUAL_MATCHER is used and each query frame counts
+    at most once per video, however many stored frames sit inside the radius.
+    """
+    if SHARDS is not None:
+        return SHARDS.visual_match_counts(query_hashes, radius)
+    if radius == 0:
+        return count_hash_matches(conn, "visual_hashes", [to_sqlite_int(h) for h, _ in query_hashes])
+    return active_visual_matcher().match_counts(query_hashes, radius)
+
+def query_file(conn, file_path):
+    """Fingerprint a media file and score it against the catalog. Returns the /query response."""
+    return score_query(conn, fingerprint_file(file_path))
 
-    # Count frequency of video IDs
-    video_scores = {}
-    for vid in audio_matches + visual_matches:
-        video_scores[vid] = video_scores.get(vid, 0) + 1
+def score_query(conn, fingerprints):
+    """Score fingerprint_file() output against the catalog. Returns the /query response."""
+    q_audio, _, q_visual = fingerprints
+    q_chroma = q_audio.get("chroma", [])
 
-    # Best match
-    best_match = max(video_scores, key=video_scores.get)
-    total_hashes = max(len(q_audio) + len(q_visual), 1)
-    similarity_ratio = video_scores[best_match] / total_hashes
+    audio_scores = query_audio_hashes(conn, q_chroma)
+    landmark_votes = query_audio_landmarks(conn, q_audio.get("landmark", []))
+    visual_scores = query_visual_hashes(conn, q_visual)
+    return build_query_result(conn, audio_scores, landmark_votes, visual_scores,
+                              len(q_chroma) + len(q_visual))
 
-    if similarity_ratio < SIMILARITY_THRESHOLD:
+def build_query_result(conn, audio_scores, landmark_votes, visual_scores, total_hashes):
+    """Pick the best match from per-video scores. Returns the /query response."""
+    if not audio_scores and not landmark_votes and not visual_scores:
+        return {"match_found": False, "message": "No match found."}
+
+    video_scores = dict(audio_scores)
+    for vid, hits in visual_scores.items():
+        video_scores[vid] = video_scores.get(vid, 0) + hits
+    total_hashes = max(total_hashes, 1)
+
+    # Best match: an offset-aligned landmark run is decisive on its own,
+    # otherwise fall back to the fraction of matching chroma/visual hashes
+    best_landmark = max(landmark_votes, key=lambda v: landmark_votes[v][0], default=None)
+    if best_landmark is not None and landmark_votes[best_landmark][0] >= LANDMARK_MIN_VOTES:
+        best_match = best_landmark
+        similarity_ratio = video_scores.get(best_match, 0) / total_hashes
+    elif video_scores:
+        best_match = max(video_scores, key=video_scores.get)
+        similarity_ratio = video_scores[best_match] / total_hashes
+        if similarity_ratio < SIMILARITY_THRESHOLD:
+            return {"match_found": False, "message": "No significant match found."}
+    else:
         return {"match_found": False, "message": "No significant match found."}
 
-    # Fetch video info
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT title, file_path FROM videos WHERE id = ?", (best_match,))
-    video_info = c.fetchone()
-    conn.close()
+    video_info = conn.execute("SELECT title, file_path FROM videos WHERE id = ?",
+                              (best_match,)).fetchone()
 
-    return {
+    result = {
         "match_found": True,
         "matched_video_id": best_match,
         "title": video_info[0],
         "file_path": video_info[1],
         "similarity_ratio": similarity_ratio,
-        "audio_matches": len(audio_matches),
-        "visual_matches": len(visual_matches)
+        "audio_matches": sum(audio_scores.values()),
+        "landmark_matches": landmark_votes.get(best_match, (0, 0))[0],
+        "visual_matches": sum(visual_scores.values())
     }
+    if best_match in landmark_votes:
+        # Where the uploaded clip starts inside the matched original
+        result["audio_offset_seconds"] = landmark_frame_to_seconds(landmark_votes[best_match][1])
+    return result
+
+# ================= STREAMING QUERY =================
+def media_duration(file_path):
+    """Longest of the audio and video stream durations, 0.0 if neither is readable."""
+    try:
+        audio = librosa.get_duration(path=file_path)
+    except Exception:
+        audio = 0.0
+    fps, frame_count, _ = video_sampling(file_path)
+    return max(audio, frame_count / fps if fps > 0 else 0.0)
+
+def query_segments(duration):
+    """Yield (start, end) seconds of growing segments covering duration.
+
+    Boundaries sit on AUDIO_HOP multiples so excerpt landmark frames line
+    up with the whole-file ones. Geometric growth keeps the repeated
+    open/seek cost per segment to a small factor of one full pass.
+    """
+    hop = AUDIO_HOP / AUDIO_SR
+    start, length = 0.0, QUERY_STREAM_FIRST_SECONDS
+    while start < duration:
+        end = round(min(start + length, duration) / hop) * hop
+        if end <= start:
+            end = start + hop
+        yield start, end
+        start = end
+        length = min(length * QUERY_STREAM_GROWTH, QUERY_STREAM_MAX_SEGMENT_SECONDS)
+
+def iter_segment_fingerprints(file_path, segments, interval=VIDEO_SAMPLE_INTERVAL, streaming=AUDIO_STREAMING):
+    """Yield fingerprint_file()-shaped output for each (start, end) of consecutive segments from 0.
+
+    The audio is decoded once, with the same decoder ingest uses, and cut
+    at the segment boundaries. (An excerpt decode of a container soundfile
+    can't read restarts from the beginning of the file, which made later
+    segments ever costlier.)
+    """
+    sizes = [int(round(end * AUDIO_SR)) - int(round(start * AUDIO_SR)) for start, end in segments]
+    blocks = iter_audio_blocks(decode_audio_chunks(file_path, streaming), 0, sizes)
+    _, _, step = video_sampling(file_path, interval)
+    for start, end in segments:
+        try:
+            block = next(blocks, None)
+        except Exception:
+            block, blocks = None, iter(())  # no decodable audio stream
+        audio = block_fingerprints(*block) if block is not None else {}
+        first, last = math.ceil(start / interval), math.ceil(end / interval)
+        visual = hash_frame_range(file_path, step, first, last) if last > first else []
+        yield audio, end - start, visual
+
+def stream_segment_fingerprints(file_path, segments, out, stop):
+    """Pool task for a streaming query: put (start, end, fingerprints) on out per segment.
+
+    Runs one segment ahead of the scoring side and stops once stop is set;
+    None on out marks the end.
+    """
+    try:
+        fingerprints = iter_segment_fingerprints(file_path, segments)
+        for start, end in segments:
+            if stop.is_set():
+                break
+            out.put((start, end, next(fingerprints)))
+    finally:
+        out.put(None)
+
+class StreamingQuery:
+    """Per-video scores accumulated segment by segment in time order."""
+
+    def __init__(self):
+        self.audio_scores = {}
+        self.landmark_votes = {}   # (video_id, offset_frames) -> votes
+        self.visual_scores = {}
+        self.total_hashes = 0
+        self.processed = 0.0
+
+    def add(self, conn, fingerprints, end):
+        q_audio, _, q_visual = fingerprints
+        q_chroma = q_audio.get("chroma", [])
+        for vid, hits in query_audio_hashes(conn, q_chroma).items():
+            self.audio_scores[vid] = self.audio_scores.get(vid, 0) + hits
+        for key, votes in landmark_offset_votes(conn, q_audio.get("landmark", [])).items():
+            self.landmark_votes[key] = self.landmark_votes.get(key, 0) + votes
+        for vid, hits in query_visual_hashes(conn, q_visual).items():
+            self.visual_scores[vid] = self.visual_scores.get(vid, 0) + hits
+        self.total_hashes += len(q_chroma) + len(q_visual)
+        self.processed = end
+
+    def scores(self):
+        scores = dict(self.audio_scores)
+        for vid, hits in self.visual_scores.items():
+            scores[vid] = scores.get(vid, 0) + hits
+        for vid, (votes, _) in best_landmark_offsets(self.landmark_votes).items():
+            scores[vid] = scores.get(vid, 0) + votes
+        return scores
+
+    def decisive(self):
+        """True once the leader clears both the absolute and the relative margin."""
+        ranked = sorted(self.scores().values(), reverse=True)
+        if not ranked or ranked[0] < QUERY_STREAM_MIN_SCORE:
+            return False
+        return len(ranked) == 1 or ranked[0] >= QUERY_STREAM_MARGIN * ranked[1]
+
+    def result(self, conn, duration):
+        result = build_query_result(conn, self.audio_scores, best_landmark_offsets(self.landmark_votes),
+                                    self.visual_scores, self.total_hashes)
+        result["early_exit"] = self.processed < duration
+        result["query_range_seconds"] = [0.0, self.processed]
+        if "audio_offset_seconds" in result:
+            offset = result["audio_offset_seconds"]
+            result["matched_range_seconds"] = [offset, offset + self.processed]
+        return result
+
+def stream_query_file(conn, file_path):
+    """Sequential streaming query (CLI / tests); the API runs it through JobQueue."""
+    duration = media_duration(file_path)
+    segments = list(query_segments(duration))
+    state = StreamingQuery()
+    for (start, end), fingerprints in zip(segments, iter_segment_fingerprints(file_path, segments)):
+        state.add(conn, fingerprints, end)
+        if state.decisive():
+            break
+    return state.result(conn, duration)
+
+# ================= JOB QUEUE =================
+class JobQueue:
+    """In-process job registry feeding a bounded fingerprinting process pool.
+
+    Fingerprinting (librosa/OpenCV) runs in worker processes; catalog reads
+    and writes run in threads, so the event loop only ever awaits. Jobs move
+    through queued -> fingerprinting -> storing/matching -> done | failed.
+    """
+
+    def __init__(self, workers=JOB_WORKERS, max_pending=JOB_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.jobs = {}
+        self.pool = None
+        self.manager = None     # queues streaming query segments back from the pool
+        self.slots = None
+
+    def start(self):
+        # spawn, not fork: the server process already runs threads
+        context = multiprocessing.get_context("spawn")
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+        self.manager = context.Manager()
+        self.slots = asyncio.Semaphore(self.workers)
+
+    def stop(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+        if self.manager is not None:
+            self.manager.shutdown()
+            self.manager = None
+
+    def pending(self):
+        return sum(1 for job in self.jobs.values() if job["status"] in ("queued", "running"))
+
+    def check_capacity(self):
+        """Reject new work up front (before reading the upload) when saturated."""
+        self._prune()
+        if self.pending() >= self.max_pending:
+            raise HTTPException(status_code=503, detail="Fingerprinting queue is full, retry later",
+                                headers={"Retry-After": "30"})
+
+    def _prune(self):
+        cutoff = time.time() - JOB_RETENTION_SECONDS
+        for job_id in [j for j, job in self.jobs.items()
+                       if job["status"] in ("done", "failed") and job["updated_at"] < cutoff]:
+            del self.jobs[job_id]
+
+    def _update(self, job, **fields):
+        job.update(fields, updated_at=time.time())
+
+    def submit(self, kind, file_path, title=None, cleanup=False, content_sha256=None):
+        self.check_capacity()
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        job = {"job_id": job_id, "kind": kind, "status": "queued", "stage": "queued",
+               "created_at": now, "updated_at": now, "content_sha256": content_sha256,
+               "result": None, "error": None}
+        self.jobs[job_id] = job
+        job["task"] = asyncio.create_task(self._run(job, file_path, title, cleanup))
+        return job
+
+    async def _run(self, job, file_path, title, cleanup):
+        loop = asyncio.get_running_loop()
+        try:
+            if job["kind"] != "stream_query":
+                async with self.slots:
+                    self._update(job, status="running", stage="fingerprinting")
+                    # One job per worker process, so no nested frame pool
+                    with METRICS.stage("fingerprint"):
+                        fingerprints = await loop.run_in_executor(self.pool, *self._task(
+                            job, fingerprint_file, file_path, 1))
+                    METRICS.inc("media_seconds_fingerprinted_total", fingerprints[1],
+                                "Seconds of media fingerprinted")
+            if job["kind"] == "stream_query":
+                result = await self._run_stream_query(job, file_path)
+            elif job["kind"] == "ingest":
+                self._update(job, stage="storing")
+                with METRICS.stage("store"):
+                    result = await asyncio.to_thread(self._store, file_path, title, fingerprints)
+            else:
+                self._update(job, stage="matching")
+                with METRICS.stage("match"):
+                    result = await asyncio.to_thread(self._score, fingerprints)
+            self._update(job, status="done", stage="done", result=result)
+        except Exception as e:
+            self._update(job, status="failed", stage="failed", error=str(e))
+        finally:
+            METRICS.inc("jobs_total", help_text="Finished fingerprinting jobs by kind and status",
+                        kind=job["kind"], status=job["status"])
+            if cleanup and os.path.exists(file_path):
+                os.unlink(file_path)
+        return job
+
+    @staticmethod
+    def _task(job, fn, *args):
+        """Pool call for fn(*args), stack-sampled in the worker if the submitting request asked for it."""
+        if profile_requested():
+            return (call_profiled, f"{job['kind']}-{job['job_id']}", fn) + args
+        return (fn,) + args
+
+    async def _run_stream_query(self, job, file_path):
+        """Score segments as one pool worker streams them in, until decisive.
+
+        The worker decodes the file once and keeps one segment ahead; a
+        decisive result stops it at its next segment boundary.
+        """
+        loop = asyncio.get_running_loop()
+        duration = await asyncio.to_thread(media_duration, file_path)
+        segments = list(query_segments(duration))
+        state = StreamingQuery()
+        out, stop = self.manager.Queue(), self.manager.Event()
+        await self.slots.acquire()
+        future = None
+        try:
+            self._update(job, status="running", stage="fingerprinting")
+            future = loop.run_in_executor(self.pool, *self._task(
+                job, stream_segment_fingerprints, file_path, segments, out, stop))
+            while True:
+                with METRICS.stage("fingerprint"):
+                    item = await self._next_segment(out, future)
+                if item is None:
+                    break
+                start, end, fingerprints = item
+                METRICS.inc("media_seconds_fingerprinted_total", end - start, "Seconds of media fingerprinted")
+                self._update(job, stage=f"matching {start:.0f}-{end:.0f}s", progress=start / duration)
+                with METRICS.stage("match"):
+                    decisive = await asyncio.to_thread(self._add_segment, state, fingerprints, end)
+                if decisive:
+                    break
+        finally:
+            stop.set()
+            if future is None:
+                self.slots.release()
+            else:
+                # The worker finishes its segment in the background; the result
+                # doesn't wait for it, but its slot stays taken until it is done
+                future.add_done_callback(self._release_slot)
+        return await asyncio.to_thread(self._stream_result, state, duration)
+
+    def _release_slot(self, future):
+        if not future.cancelled():
+            future.exception()  # retrieved, so a worker error after an early exit isn't reported as unhandled
+        self.slots.release()
+
+    @staticmethod
+    async def _next_segment(out, future):
+        """Next (start, end, fingerprints) from the worker, or None once it is done."""
+        while True:
+            try:
+                item = await asyncio.to_thread(out.get, True, 1.0)
+            except queue.Empty:
+                if future.done():
+                    future.result()  # re-raise a worker failure
+                    return None
+                continue
+            if item is None:
+                await future
+            return item
+
+    @staticmethod
+    def _add_segment(state, fingerprints, end):
+        conn = get_connection()
+        try:
+            state.add(conn, fingerprints, end)
+        finally:
+            conn.close()
+        return state.decisive()
+
+    @staticmethod
+    def _stream_result(state, duration):
+        conn = get_connection()
+        try:
+            return state.result(conn, duration)
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _store(file_path, title, fingerprints):
+        conn = get_connection()
+        try:
+            return store_ingest(conn, file_path, title, fingerprints, active_visual_matcher())
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _score(fingerprints):
+        conn = get_connection()
+        try:
+            return score_query(conn, fingerprints)
+        finally:
+            conn.close()
+
+    def status(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Unknown job id")
+        info = {k: v for k, v in job.items() if k not in ("task", "result")}
+        info["queue_depth"] = self.pending()
+        return info
+
+    async def wait(self, job):
+        await job["task"]
+        if job["status"] == "failed":
+            raise HTTPException(status_code=500, detail=f"Processing failed: {job['error']}")
+        return job["result"]
+
+JOB_QUEUE = JobQueue()
+METRICS.gauge("job_queue_depth", JOB_QUEUE.pending, "Fingerprinting jobs queued or running")
+METRICS.gauge("visual_index_hashes", lambda: len(VISUAL_INDEX.hashes), "Frame hashes in the in-memory visual index")
+
+async def save_upload(file, directory, prefix):
+    """Stream an upload to disk; return (path, sha256 hex)."""
+    path = os.path.join(directory, f"{prefix}_{os.path.basename(file.filename)}")
+    with METRICS.stage("upload"):
+        _, digest = await stream_upload(file, path)
+    return path, digest
+
+async def submit_ingest(file, title):
+    JOB_QUEUE.check_capacity()
+    temp_path, digest = await save_upload(file, UPLOAD_DIR, uuid.uuid4().hex[:8])
+    return JOB_QUEUE.submit("ingest", temp_path, title, content_sha256=digest)
+
+async def submit_query(file, mode="full"):
+    if mode not in ("full", "stream"):
+        raise HTTPException(status_code=400, detail="mode must be 'full' or 'stream'")
+    JOB_QUEUE.check_capacity()
+    temp_path, digest = await save_upload(file, tempfile.gettempdir(), uuid.uuid4().hex[:8])
+    kind = "stream_query" if mode == "stream" else "query"
+    return JOB_QUEUE.submit(kind, temp_path, cleanup=True, content_sha256=digest)
+
+# ================= FASTAPI ENDPOINTS =================
+@app.post("/ingest")
+async def ingest_video(file: UploadFile = File(...), title: str = Form("Untitled")):
+    """Ingest a new video and store audio-visual fingerprints."""
+    job = await submit_ingest(file, title)
+    return await JOB_QUEUE.wait(job)
+
+@app.post("/query")
+async def query_video(file: UploadFile = File(...), mode: str = Form("full")):
+    """Query uploaded video for pirated content.
+
+    mode="stream" fingerprints the upload in time order and stops as soon
+    as one catalog video is a clear winner.
+    """
+    job = await submit_query(file, mode)
+    return await JOB_QUEUE.wait(job)
+
+@app.post("/jobs/ingest", status_code=202)
+async def submit_ingest_job(file: UploadFile = File(...), title: str = Form("Untitled")):
+    """Queue an ingest and return its job id immediately."""
+    job = await submit_ingest(file, title)
+    return JOB_QUEUE.status(job["job_id"])
+
+@app.post("/jobs/query", status_code=202)
+async def submit_query_job(file: UploadFile = File(...), mode: str = Form("full")):
+    """Queue a piracy query and return its job id immediately."""
+    job = await submit_query(file, mode)
+    return JOB_QUEUE.status(job["job_id"])
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    return JOB_QUEUE.status(job_id)
+
+@app.get("/jobs/{job_id}/result")
+async def job_result(job_id: str):
+    """Result of a finished job; 202 with the status while it is still pending."""
+    info = JOB_QUEUE.status(job_id)
+    if info["status"] in ("queued", "running"):
+        return JSONResponse(status_code=202, content=info)
+    if info["status"] == "failed":
+        raise HTTPException(status_code=500, detail=f"Processing failed: {info['error']}")
+    return JOB_QUEUE.jobs[job_id]["result"]
 
 @app.get("/")
 def root():
     return {"message": "Anti-Piracy Fingerprinting API Running!"}
+
+# ================= BULK IMPORT CLI =================
+def find_media_files(directory):
+    """Yield video files under directory in a stable order."""
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(VIDEO_EXTENSIONS):
+                yield os.path.join(root, name)
+
+def bulk_import(directory, db_path=DB_PATH):
+    """Fingerprint every video under directory and load it into db_path.
+
+    One connection is shared across the run and each file is committed as
+    its own transaction, so an interrupted import keeps what it finished.
+    """
+    create_tables(db_path)
+    if SHARD_COUNT and SHARDS is None:
+        open_shards(db_path)
+    conn = get_connection(db_path)
+    results = []
+    try:
+        for path in find_media_files(directory):
+            title = os.path.splitext(os.path.basename(path))[0]
+            try:
+                summary = ingest_file(conn, os.path.abspath(path), title)
+            except Exception as e:
+                print(f"FAILED {path}: {e}")
+                continue
+            print(f"Ingested {path} -> video_id={summary['video_id']} "
+                  f"({summary['audio_hashes']} audio, {summary['visual_hashes']} visual hashes)")
+            results.append(summary)
+    finally:
+        conn.close()
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Anti-piracy fingerprint tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_import = sub.add_parser("import", help="fingerprint and ingest every video in a directory")
+    p_import.add_argument("directory")
+    p_import.add_argument("--db", default=DB_PATH, help="SQLite database path")
+    p_reshard = sub.add_parser("reshard", help="redistribute the catalog over N shards")
+    p_reshard.add_argument("shards", type=int)
+    p_reshard.add_argument("--db", default=DB_PATH, help="SQLite database path")
+    p_reshard.add_argument("--dir", default=SHARD_DIR, help="shard directory")
+    args = parser.parse_args()
+
+    if args.command == "import":
+        imported = bulk_import(args.directory, args.db)
+        print(f"Imported {len(imported)} file(s) into {args.db}")
+        if SHARDS is not None:
+            SHARDS.close()
+    elif args.command == "reshard":
+        create_tables(args.db)
+        catalog = open_shards(args.db, args.dir, args.shards)
+        print(f"{args.dir}: {catalog.count} shard(s), generation {catalog.generation}")
+        catalog.close()
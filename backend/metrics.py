@@ -0,0 +1,220 @@
+import os
+import sys
+import time
+import threading
+import contextvars
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from fastapi.responses import PlainTextResponse
+
+# ================= CONFIGURATION =================
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+# Sampling profiler: with PROFILE_DIR set, a request carrying an
+# "X-Profile: 1" header is sampled and its stacks written there
+PROFILE_DIR = os.getenv("PROFILE_DIR", "")
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+
+# Stage timings of the request being served, for its Server-Timing header
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+# Set for a request sent with "X-Profile: 1"; background jobs it starts inherit it
+_profile_requested = contextvars.ContextVar("profile_requested", default=False)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _label_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+class Metrics:
+    """Counters, duration histograms and scrape-time gauges, rendered in Prometheus text format."""
+
+    def __init__(self, namespace):
+        self.namespace = namespace
+        self.lock = threading.Lock()
+        self.counters = defaultdict(float)      # (name, labels) -> value
+        self.histograms = {}                    # (name, labels) -> [per-bucket counts, sum, count]
+        self.gauges = {}                        # name -> callable returning a value or {labels: value}
+        self.help = {}
+        self.types = {}
+
+    def _declare(self, name, kind, help_text):
+        if name not in self.types:
+            self.types[name] = kind
+            self.help[name] = help_text
+
+    def inc(self, name, value=1.0, help_text="", **labels):
+        self._declare(name, "counter", help_text)
+        with self.lock:
+            self.counters[(name, tuple(sorted(labels.items())))] += value
+
+    def observe(self, name, value, help_text="", **labels):
+        self._declare(name, "histogram", help_text)
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            entry = self.histograms.setdefault(key, [[0] * len(STAGE_BUCKETS), 0.0, 0])
+            for i, bound in enumerate(STAGE_BUCKETS):
+                if value <= bound:
+                    entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def gauge(self, name, fn, help_text=""):
+        """Register fn, called at scrape time; it returns a number or {(("label", "value"), ...): number}."""
+        self._declare(name, "gauge", help_text)
+        self.gauges[name] = fn
+
+    @contextmanager
+    def stage(self, name):
+        """Time a pipeline stage into the stage histogram and the current request's Server-Timing."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.observe("stage_duration_seconds", elapsed, "Time spent in each pipeline stage", stage=name)
+            timings = _request_timings.get()
+            if timings is not None:
+                timings.append((name, elapsed))
+
+    def render(self):
+        lines = []
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = {key: (list(buckets), total, count) for key, (buckets, total, count) in self.histograms.items()}
+        by_name = defaultdict(list)
+        for (name, labels), value in counters.items():
+            by_name[name].append((labels, value))
+        for (name, labels), value in histograms.items():
+            by_name[name].append((labels, value))
+        for name, fn in self.gauges.items():
+            try:
+                value = fn()
+            except Exception:
+                continue
+            if value is None:
+                continue
+            by_name[name] = list(value.items()) if isinstance(value, dict) else [((), value)]
+
+        for name in sorted(by_name):
+            full = f"{self.namespace}_{name}"
+            if self.help.get(name):
+                lines.append(f"# HELP {full} {self.help[name]}")
+            lines.append(f"# TYPE {full} {self.types[name]}")
+            for labels, value in sorted(by_name[name], key=lambda item: item[0]):
+                if self.types[name] != "histogram":
+                    lines.append(f"{full}{_label_text(labels)} {float(value):g}")
+                    continue
+                buckets, total, count = value
+                for bound, bucket_count in zip(STAGE_BUCKETS, buckets):
+                    lines.append(f"{full}_bucket{_label_text(labels + (('le', f'{bound:g}'),))} {bucket_count}")
+                lines.append(f"{full}_bucket{_label_text(labels + (('le', '+Inf'),))} {count}")
+                lines.append(f"{full}_sum{_label_text(labels)} {total:g}")
+                lines.append(f"{full}_count{_label_text(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+def server_timing(timings):
+    """Server-Timing header value; repeated stages are summed."""
+    totals = {}
+    for name, seconds in timings:
+        totals[name] = totals.get(name, 0.0) + seconds
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in totals.items())
+
+class StackSampler:
+    """Samples the Python stacks of all threads at a fixed interval.
+
+    save() writes them in collapsed "frame;frame;frame count" form, which
+    flamegraph.pl, speedscope and similar tools read directly.
+    """
+
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def collapsed(self):
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+    def save(self, directory, label):
+        os.makedirs(directory, exist_ok=True)
+        safe = "".join(c if c.isalnum() else "_" for c in label).strip("_") or "request"
+        path = os.path.join(directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{safe}.folded")
+        with open(path, "w") as f:
+            f.write(self.collapsed())
+        return path
+
+@contextmanager
+def profiled(label, directory=PROFILE_DIR, interval=PROFILE_INTERVAL):
+    """Sample stacks for the duration of the block and save them under directory."""
+    sampler = StackSampler(interval).start()
+    try:
+        yield sampler
+    finally:
+        sampler.stop()
+        sampler.save(directory, label)
+
+def profile_requested():
+    """True inside a request (or a job it started) that asked for X-Profile sampling."""
+    return _profile_requested.get()
+
+def call_profiled(label, fn, *args):
+    """fn(*args) under profiled(label); module level so it can be sent to a process pool."""
+    with profiled(label):
+        return fn(*args)
+
+def instrument_app(app, metrics):
+    """Add request metrics, Server-Timing headers, X-Profile sampling and a /metrics endpoint."""
+    @app.middleware("http")
+    async def record_request(request, call_next):
+        timings = []
+        token = _request_timings.set(timings)
+        profile = bool(PROFILE_DIR and request.headers.get("x-profile"))
+        profile_token = _profile_requested.set(profile)
+        sampler = StackSampler().start() if profile else None
+        started = time.perf_counter()
+        try:
+            response = await call_next(request)
+        finally:
+            _request_timings.reset(token)
+            _profile_requested.reset(profile_token)
+            if sampler is not None:
+                sampler.stop()
+                sampler.save(PROFILE_DIR, f"{request.method}-{request.url.path}")
+        elapsed = time.perf_counter() - started
+        route = request.scope.get("route")
+        path = route.path if route is not None else "unmatched"
+        metrics.inc("http_requests_total", help_text="HTTP requests by route and status",
+                    method=request.method, path=path, status=str(response.status_code))
+        metrics.observe("http_request_duration_seconds", elapsed, "HTTP request latency until headers are sent",
+                        path=path)
+        response.headers["Server-Timing"] = server_timing(timings + [("total", elapsed)])
+        return response
+
+    @app.get("/metrics")
+    def metrics_endpoint():
+        return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
@@ -1,15 +1,35 @@
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException
-from fastapi.responses import Response
+from fastapi.responses import Response, StreamingResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from sarvamai import SarvamAI
 from dotenv import load_dotenv
-from moviepy.editor import VideoFileClip
 import google.generativeai as genai
 import whisper
+import numpy as np
 import os
+import wave
 import json
 import tempfile
 import logging
+import threading
+import time
+import gc
+import re
+import sqlite3
+import hashlib
+import unicodedata
+import io
+import zipfile
+import uuid
+import socket
+import asyncio
+import multiprocessing
+import contextvars
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, Future
+from contextlib import contextmanager
+from uploads import stream_upload, add_upload_limit
+from metrics import Metrics, instrument_app, profile_requested, call_profiled
+import transcribe_worker
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -19,6 +39,8 @@ load_dotenv()
 
 app = FastAPI(title="Audio/Video Subtitle Generator with Emotion Detection")
 
+# Registered before CORS so CORS wraps it and its early 413 still carries the CORS headers
+add_upload_limit(app)
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -27,6 +49,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+METRICS = Metrics("subtitles")
+instrument_app(app, METRICS)
 
 SARVAM_API_KEY = os.getenv("SARVAM_API_KEY")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
@@ -34,30 +58,247 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 # Configure Gemini
 genai.configure(api_key=GEMINI_API_KEY)
 
+SARVAM_MODEL = "saaras:v2.5"
+# Sarvam requests arriving within this window share one batch job (up to
+# SARVAM_BATCH_MAX_FILES files); SARVAM_FAKE=1 uses the local fake client
+SARVAM_BATCH_WINDOW_SECONDS = float(os.getenv("SARVAM_BATCH_WINDOW_SECONDS", "2"))
+SARVAM_BATCH_MAX_FILES = int(os.getenv("SARVAM_BATCH_MAX_FILES", "20"))
+SARVAM_FAKE = os.getenv("SARVAM_FAKE", "") == "1"
+# GEMINI_FAKE=1 translates with the local fake model (no API key needed)
+GEMINI_FAKE = os.getenv("GEMINI_FAKE", "") == "1"
+
+SUPPORTED_EMOTIONS = [
+    "neutral", "happy", "sad", "angry", "surprised", "fearful",
+    "disgusted", "confused", "excited", "calm", "sarcastic",
+    "serious", "playful", "romantic", "apologetic", "grateful",
+    "proud", "concerned", "hopeful", "frustrated"
+]
+
 # Indian language codes
 INDIAN_LANGUAGES = {
     "hi", "bn", "te", "ta", "mr", "ur", "gu", "kn", "ml", "pa", 
     "or", "as", "sa", "sd", "ks", "ne", "si", "my"
 }
 
-# Load Whisper model (load once at startup)
-WHISPER_MODEL = whisper.load_model("base")
+# Whisper works on 16 kHz mono audio
+WHISPER_SAMPLE_RATE = 16000
+
+# Whisper model sizes: a small one is enough to detect the language
+WHISPER_DETECT_MODEL = os.getenv("WHISPER_DETECT_MODEL", "tiny")
+WHISPER_TRANSCRIBE_MODEL = os.getenv("WHISPER_TRANSCRIBE_MODEL", "base")
+# Models unused for this long are dropped; preloaded models are kept
+WHISPER_IDLE_SECONDS = float(os.getenv("WHISPER_IDLE_SECONDS", "600"))
+# Comma-separated sizes loaded at import, e.g. "tiny,base", so that workers
+# forked from a preloading server (gunicorn --preload) share the weights
+WHISPER_PRELOAD = [name for name in os.getenv("WHISPER_PRELOAD", "").split(",") if name]
+
+class WhisperModels:
+    """Whisper models loaded on first use, keyed by size, evicted when idle."""
+
+    def __init__(self, idle_seconds=WHISPER_IDLE_SECONDS):
+        self.idle_seconds = idle_seconds
+        self.models = {}        # name -> {"model", "last_used", "users", "pinned", "busy"}
+        self.load_locks = {}
+        self.lock = threading.Lock()
+        self.reaper = None
+
+    def _load(self, name, pinned=False):
+        with self.lock:
+            load_lock = self.load_locks.setdefault(name, threading.Lock())
+        # Concurrent first users wait for a single load
+        with load_lock:
+            with self.lock:
+                entry = self.models.get(name)
+            if entry is None:
+                logger.info(f"Loading Whisper model '{name}'")
+                started = time.time()
+                model = whisper.load_model(name)
+                logger.info(f"Loaded Whisper model '{name}' in {time.time() - started:.1f}s")
+                entry = {"model": model, "last_used": time.time(), "users": 0, "pinned": pinned,
+                         "busy": threading.Lock()}
+                with self.lock:
+                    self.models[name] = entry
+                self._start_reaper()
+            return entry
+
+    def preload(self, names):
+        for name in names:
+            self._load(name, pinned=True)
+
+    @contextmanager
+    def use(self, name):
+        """
+        Borrow the named model; it cannot be evicted while borrowed.
+        Borrowers of one model take turns: Whisper's decoder installs its
+        KV-cache hooks on the shared modules, so concurrent calls would
+        corrupt each other.
+        """
+        with self.lock:
+            entry = self.models.get(name)
+            if entry is not None:
+                entry["users"] += 1
+        if entry is None:
+            entry = self._load(name)
+            with self.lock:
+                entry["users"] += 1
+        try:
+            with entry["busy"]:
+                yield entry["model"]
+        finally:
+            with self.lock:
+                entry["users"] -= 1
+                entry["last_used"] = time.time()
+
+    def evict_idle(self):
+        cutoff = time.time() - self.idle_seconds
+        with self.lock:
+            idle = [name for name, entry in self.models.items()
+                    if not entry["pinned"] and not entry["users"] and entry["last_used"] < cutoff]
+            for name in idle:
+                del self.models[name]
+        if idle:
+            logger.info(f"Evicted idle Whisper models: {', '.join(idle)}")
+            gc.collect()
+        return idle
+
+    def _start_reaper(self):
+        # Started lazily, so a forked worker gets its own reaper on first load
+        if self.reaper is not None and self.reaper.is_alive():
+            return
+        def reap():
+            while True:
+                time.sleep(max(self.idle_seconds / 4, 1))
+                self.evict_idle()
+        self.reaper = threading.Thread(target=reap, name="whisper-reaper", daemon=True)
+        self.reaper.start()
+
+WHISPER_MODELS = WhisperModels()
+WHISPER_MODELS.preload(WHISPER_PRELOAD)
+
+# Parallel transcription: with more than one worker, long audio is cut at
+# silences into chunks of at most WHISPER_CHUNK_SECONDS that are transcribed
+# in separate processes. 0 or 1 keeps the single sequential transcribe call.
+WHISPER_PARALLEL_WORKERS = int(os.getenv("WHISPER_PARALLEL_WORKERS", "0"))
+WHISPER_CHUNK_SECONDS = float(os.getenv("WHISPER_CHUNK_SECONDS", "120"))
+VAD_FRAME_SECONDS = 0.03
+VAD_SMOOTH_FRAMES = 10          # ~0.3 s: cut in a pause, not a single quiet frame
+VAD_SEARCH_FRACTION = 0.25      # look for the cut in the last quarter of a chunk
+VAD_SILENCE_DB = -50.0          # chunks never louder than this are skipped
+
+# Gemini translation: cues per request, preceding cues sent as context,
+# concurrent requests per file and attempts per window
+TRANSLATION_WINDOW_CUES = int(os.getenv("TRANSLATION_WINDOW_CUES", "60"))
+TRANSLATION_CONTEXT_CUES = int(os.getenv("TRANSLATION_CONTEXT_CUES", "5"))
+TRANSLATION_CONCURRENCY = int(os.getenv("TRANSLATION_CONCURRENCY", "4"))
+TRANSLATION_ATTEMPTS = 3
+# Multi-language requests: languages per request and translated at once
+MAX_TARGET_LANGUAGES = int(os.getenv("MAX_TARGET_LANGUAGES", "16"))
+TARGET_LANGUAGE_CONCURRENCY = int(os.getenv("TARGET_LANGUAGE_CONCURRENCY", "4"))
+# Bump whenever the translation prompt changes, so cached cues are not reused
+TRANSLATION_PROMPT_VERSION = 2
+
+# Persistent cue-level translation cache; an empty path disables it
+TRANSLATION_CACHE_PATH = os.getenv("TRANSLATION_CACHE_PATH", "translation_cache.db")
+TRANSLATION_CACHE_MAX_ENTRIES = int(os.getenv("TRANSLATION_CACHE_MAX_ENTRIES", "500000"))
+TRANSLATION_CACHE_TTL_SECONDS = float(os.getenv("TRANSLATION_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+
+# Asynchronous subtitle jobs: store, upload directory, worker threads,
+# admission limit, how long finished jobs are kept, and how long a worker's
+# claim on a job lasts without a heartbeat before another worker resumes it
+SUBTITLE_JOB_DB = os.getenv("SUBTITLE_JOB_DB", "subtitle_jobs.db")
+SUBTITLE_JOB_DIR = os.getenv("SUBTITLE_JOB_DIR", "subtitle_jobs")
+SUBTITLE_JOB_WORKERS = int(os.getenv("SUBTITLE_JOB_WORKERS", "2"))
+SUBTITLE_JOB_MAX_PENDING = int(os.getenv("SUBTITLE_JOB_MAX_PENDING", "32"))
+SUBTITLE_JOB_RETENTION_SECONDS = float(os.getenv("SUBTITLE_JOB_RETENTION_SECONDS", str(24 * 3600)))
+SUBTITLE_JOB_LEASE_SECONDS = float(os.getenv("SUBTITLE_JOB_LEASE_SECONDS", "60"))
 
-def detect_language(audio_path: str) -> str:
+# Whole-pipeline result cache keyed by upload content hash; empty path disables it
+RESULT_CACHE_PATH = os.getenv("RESULT_CACHE_PATH", "result_cache.db")
+RESULT_CACHE_TTL_SECONDS = float(os.getenv("RESULT_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+
+# Streaming endpoint: length of the timeline windows emitted one at a time
+STREAM_WINDOW_SECONDS = float(os.getenv("STREAM_WINDOW_SECONDS", "20"))
+
+def split_on_silence(audio: np.ndarray, max_seconds: float = WHISPER_CHUNK_SECONDS) -> list:
     """
-    Detect the primary language of the audio file
+    Split audio into (start, end) sample ranges of at most max_seconds,
+    cutting each at the quietest point near its end. Ranges with no frame
+    above VAD_SILENCE_DB are dropped.
+    """
+    frame = int(WHISPER_SAMPLE_RATE * VAD_FRAME_SECONDS)
+    n_frames = len(audio) // frame
+    if n_frames == 0:
+        return [(0, len(audio))] if len(audio) else []
+    power = np.square(audio[:n_frames * frame].reshape(n_frames, frame), dtype=np.float64).mean(axis=1)
+    level_db = 10 * np.log10(power + 1e-10)
+    smoothed = np.convolve(power, np.ones(VAD_SMOOTH_FRAMES) / VAD_SMOOTH_FRAMES, mode="same")
+    
+    max_frames = max(int(max_seconds / VAD_FRAME_SECONDS), 1)
+    search = max(int(max_frames * VAD_SEARCH_FRACTION), 1)
+    cuts = [0]
+    while n_frames - cuts[-1] > max_frames:
+        lo = cuts[-1] + max_frames - search
+        cuts.append(lo + int(np.argmin(smoothed[lo:cuts[-1] + max_frames])) + 1)
+    cuts.append(n_frames)
+    
+    ranges = []
+    for first, last in zip(cuts, cuts[1:]):
+        if level_db[first:last].max() > VAD_SILENCE_DB:
+            end = len(audio) if last == n_frames else last * frame
+            ranges.append((first * frame, end))
+    return ranges
+
+def transcribe_chunk(audio: np.ndarray, language: str, offset: float) -> list:
+    """Transcribe one chunk in this process and return its segments on the full-file timeline"""
+    with WHISPER_MODELS.use(WHISPER_TRANSCRIBE_MODEL) as model:
+        result = model.transcribe(audio, language=language, verbose=False, task="transcribe")
+    return transcribe_worker.shifted_segments(result, offset)
+
+TRANSCRIBE_POOL = None
+
+def get_transcribe_pool() -> ProcessPoolExecutor:
+    """
+    Process pool for parallel transcription, created on first use. Its
+    workers import only transcribe_worker, and each loads its own model.
+    """
+    global TRANSCRIBE_POOL
+    if TRANSCRIBE_POOL is None:
+        threads = max((os.cpu_count() or 1) // WHISPER_PARALLEL_WORKERS, 1)
+        TRANSCRIBE_POOL = ProcessPoolExecutor(
+            max_workers=WHISPER_PARALLEL_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            # Split the cores between workers instead of oversubscribing them
+            initializer=transcribe_worker.init_worker,
+            initargs=(WHISPER_TRANSCRIBE_MODEL, threads)
+        )
+    return TRANSCRIBE_POOL
+
+def transcribe_parallel(audio: np.ndarray, language: str = None) -> list:
+    """Transcribe silence-split chunks across the worker pool; segments come back in time order"""
+    ranges = split_on_silence(audio)
+    logger.info(f"Transcribing {len(ranges)} chunk(s) on {WHISPER_PARALLEL_WORKERS} workers")
+    pool = get_transcribe_pool()
+    futures = [
+        pool.submit(transcribe_worker.transcribe_chunk, audio[start:end], language, start / WHISPER_SAMPLE_RATE)
+        for start, end in ranges
+    ]
+    return [segment for future in futures for segment in future.result()]
+
+def detect_language(audio: np.ndarray) -> str:
+    """
+    Detect the primary language of decoded 16 kHz audio
     Returns language code (e.g., 'en', 'hi', 'fr', etc.)
     """
     try:
-        # Load audio and pad/trim it to fit 30 seconds
-        audio = whisper.load_audio(audio_path)
+        # Pad/trim it to fit 30 seconds
         audio = whisper.pad_or_trim(audio)
         
-        # Make log-Mel spectrogram and move to the same device as the model
-        mel = whisper.log_mel_spectrogram(audio).to(WHISPER_MODEL.device)
-        
-        # Detect the spoken language
-        _, probs = WHISPER_MODEL.detect_language(mel)
+        with METRICS.stage("detect_language"), WHISPER_MODELS.use(WHISPER_DETECT_MODEL) as model:
+            # Make log-Mel spectrogram and move to the same device as the model
+            mel = whisper.log_mel_spectrogram(audio, model.dims.n_mels).to(model.device)
+            
+            # Detect the spoken language
+            _, probs = model.detect_language(mel)
         detected_lang = max(probs, key=probs.get)
         
         logger.info(f"Detected language: {detected_lang} with probability: {probs[detected_lang]:.2f}")
@@ -92,21 +333,28 @@ def format_time(seconds: float) -> str:
     millis = int((seconds - int(seconds)) * 1000)
     return f"{hours:02d}:{minutes:02d}:{secs:02d},{millis:03d}"
 
-def process_with_sarvam(file_path: str) -> dict:
-    """Process audio file with SarvamAI API - Batch Speech-to-Text Translation"""
+def create_sarvam_client():
+    if SARVAM_FAKE:
+        from fakes import FakeSarvamAI
+        return FakeSarvamAI()
+    return SarvamAI(api_subscription_key=SARVAM_API_KEY)
+
+def run_sarvam_job(client, file_paths: list) -> dict:
+    """
+    Transcribe several audio files in one Sarvam batch STT translation job
+    Returns {file path: JSON output}; files without an output are left out
+    """
     with tempfile.TemporaryDirectory() as temp_dir:
-        client = SarvamAI(api_subscription_key=SARVAM_API_KEY)
-        
         # Create batch STT translation job
         job = client.speech_to_text_translate_job.create_job(
-            model="saaras:v2.5",
+            model=SARVAM_MODEL,
             with_diarization=True,
             num_speakers=100000000000000,
             prompt="Official meeting"
         )
         
         # Upload and process audio
-        job.upload_files(file_paths=[file_path])
+        job.upload_files(file_paths=file_paths)
         job.start()
         job.wait_until_complete()
         
@@ -116,27 +364,125 @@ def process_with_sarvam(file_path: str) -> dict:
         # Download to temporary directory
         job.download_outputs(output_dir=temp_dir)
         
-        # Find and read JSON file
-        json_files = [f for f in os.listdir(temp_dir) if f.endswith('.json')]
-        if not json_files:
-            raise Exception("No JSON output file found from Sarvam AI")
-        
-        json_file_path = os.path.join(temp_dir, json_files[0])
-        with open(json_file_path, 'r', encoding='utf-8') as f:
-            json_data = json.load(f)
-        
-        return json_data
+        # Outputs are named after their input files
+        json_files = sorted(f for f in os.listdir(temp_dir) if f.endswith('.json'))
+        outputs = {}
+        for file_path in file_paths:
+            name = os.path.basename(file_path)
+            stem = os.path.splitext(name)[0]
+            matches = ([f for f in json_files if f in (f"{name}.json", f"{stem}.json")]
+                       or [f for f in json_files if f.startswith(stem)])
+            if not matches and len(file_paths) == 1:
+                matches = json_files
+            if matches:
+                with open(os.path.join(temp_dir, matches[0]), 'r', encoding='utf-8') as f:
+                    outputs[file_path] = json.load(f)
+        return outputs
+
+class SarvamBatcher:
+    """
+    Collects Sarvam requests from concurrent callers for up to window_seconds
+    (or max_files files) and submits them as one batch job through a shared
+    client; each caller gets its own file's output back.
+    """
+
+    def __init__(self, client_factory=create_sarvam_client, window_seconds: float = SARVAM_BATCH_WINDOW_SECONDS,
+                 max_files: int = SARVAM_BATCH_MAX_FILES):
+        self.client_factory = client_factory
+        self.window_seconds = window_seconds
+        self.max_files = max_files
+        self.client = None
+        self.lock = threading.Lock()
+        self.waiting = []
+        self.timer = None
+        self.jobs = 0
+        self.files = 0
+
+    def _client(self):
+        with self.lock:
+            if self.client is None:
+                self.client = self.client_factory()
+            return self.client
+
+    def transcribe(self, file_path: str) -> dict:
+        """Block until the batch containing file_path finishes; return its JSON output"""
+        future = Future()
+        batch = None
+        with self.lock:
+            self.waiting.append((file_path, future, time.perf_counter()))
+            if len(self.waiting) >= self.max_files:
+                batch = self._take()
+            elif self.timer is None:
+                self.timer = threading.Timer(self.window_seconds, self._flush)
+                self.timer.daemon = True
+                self.timer.start()
+        if batch:
+            threading.Thread(target=self._run, args=(batch,), daemon=True).start()
+        return future.result()
+
+    def _take(self) -> list:
+        batch, self.waiting = self.waiting, []
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        return batch
 
-def process_with_whisper(file_path: str, language: str = None) -> dict:
-    """Process audio file with Whisper for non-Indian languages"""
+    def _flush(self):
+        with self.lock:
+            batch = self._take()
+        if batch:
+            self._run(batch)
+
+    def _run(self, batch: list):
+        paths = [file_path for file_path, _, _ in batch]
+        started = time.perf_counter()
+        for _, _, queued_at in batch:
+            METRICS.observe("stage_duration_seconds", started - queued_at, stage="sarvam_queue")
+        logger.info(f"Submitting {len(paths)} file(s) to Sarvam AI in one batch job")
+        try:
+            with METRICS.stage("sarvam_job"):
+                outputs = run_sarvam_job(self._client(), paths)
+        except Exception as e:
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+        finally:
+            with self.lock:
+                self.jobs += 1
+                self.files += len(paths)
+        for file_path, future, _ in batch:
+            if file_path in outputs:
+                future.set_result(outputs[file_path])
+            else:
+                future.set_exception(Exception("No JSON output file found from Sarvam AI"))
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"jobs": self.jobs, "files": self.files, "waiting": len(self.waiting)}
+
+SARVAM_BATCHER = SarvamBatcher()
+
+def process_with_sarvam(file_path: str) -> dict:
+    """Process audio file with SarvamAI API - Batch Speech-to-Text Translation (micro-batched)"""
+    with METRICS.stage("sarvam"):
+        return SARVAM_BATCHER.transcribe(file_path)
+
+def process_with_whisper(audio: np.ndarray, language: str = None) -> dict:
+    """Process decoded 16 kHz audio with Whisper for non-Indian languages"""
     try:
-        # Transcribe audio with Whisper
-        result = WHISPER_MODEL.transcribe(
-            file_path,
-            language=language,
-            verbose=False,
-            task="transcribe"
-        )
+        # Transcribe audio with Whisper, in parallel chunks when configured
+        with METRICS.stage("whisper"):
+            if WHISPER_PARALLEL_WORKERS > 1 and len(audio) > WHISPER_CHUNK_SECONDS * WHISPER_SAMPLE_RATE:
+                segments = transcribe_parallel(audio, language)
+            else:
+                with WHISPER_MODELS.use(WHISPER_TRANSCRIBE_MODEL) as model:
+                    result = model.transcribe(
+                        audio,
+                        language=language,
+                        verbose=False,
+                        task="transcribe"
+                    )
+                segments = result["segments"]
         
         # Convert to similar format as Sarvam output for consistency
         formatted_result = {
@@ -147,7 +493,7 @@ def process_with_whisper(file_path: str, language: str = None) -> dict:
                         "end_time_seconds": segment["end"],
                         "transcript": segment["text"].strip()
                     }
-                    for segment in result["segments"]
+                    for segment in segments
                 ]
             }
         }
@@ -172,58 +518,52 @@ def get_language_name(lang_code: str) -> str:
     }
     return language_map.get(lang_code, lang_code.upper())
 
-def translate_srt_with_gemini(srt_content: str, target_lang: str, source_lang: str = "auto") -> str:
-    """
-    Translate entire SRT file using Gemini API with emotion detection
-    Uploads the complete SRT as a file to Gemini
-    """
-    if not srt_content.strip():
-        return srt_content
+def create_translation_model():
+    """Gemini model used for subtitle translation"""
+    if GEMINI_FAKE:
+        from fakes import FakeGenerativeModel
+        return FakeGenerativeModel()
+    return genai.GenerativeModel(
+        model_name="gemini-2.0-flash-exp",
+        generation_config={
+            "temperature": 0.3,
+            "top_p": 0.95,
+            "top_k": 40,
+            "max_output_tokens": 8192,
+            "response_mime_type": "application/json",
+        }
+    )
+
+def format_srt(cues: list) -> str:
+    """Inverse of parse_srt()"""
+    return "\n".join(f"{cue['index']}\n{cue['start']} --> {cue['end']}\n{cue['text']}\n" for cue in cues)
+
+def cue_records(cues: list) -> str:
+    """Cues as the JSON id/text records sent to the model"""
+    return json.dumps([{"id": cue["index"], "text": cue["text"]} for cue in cues], ensure_ascii=False, indent=1)
+
+def build_translation_prompt(cues: list, target_lang: str, source_lang: str, context: list = ()) -> str:
+    """Translation prompt for a set of cues, with the preceding cues as read-only context"""
+    target_language_name = get_language_name(target_lang)
+    context_section = ""
+    if context:
+        context_section = f"""PRECEDING SUBTITLES (context only, for names, terms and tone - do NOT include them in the output):
+{cue_records(context)}
+
+"""
     
-    try:
-        # Create a temporary file for the SRT content
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.srt', delete=False, encoding='utf-8') as temp_srt:
-            temp_srt.write(srt_content)
-            temp_srt_path = temp_srt.name
-        
-        # Upload the file to Gemini
-        logger.info(f"Uploading SRT file to Gemini for translation to {target_lang}")
-        uploaded_file = genai.upload_file(temp_srt_path, mime_type="text/plain")
-        
-        # Wait for file to be processed
-        import time
-        while uploaded_file.state.name == "PROCESSING":
-            time.sleep(1)
-            uploaded_file = genai.get_file(uploaded_file.name)
-        
-        if uploaded_file.state.name == "FAILED":
-            raise Exception("File upload to Gemini failed")
-        
-        # Create the model
-        model = genai.GenerativeModel(
-            model_name="gemini-2.0-flash-exp",
-            generation_config={
-                "temperature": 0.3,
-                "top_p": 0.95,
-                "top_k": 40,
-                "max_output_tokens": 8192,
-            }
-        )
-        
-        target_language_name = get_language_name(target_lang)
-        
-        # Create comprehensive prompt for translation with emotion detection
-        prompt = f"""You are a professional subtitle translator with expertise in emotion detection and cultural adaptation.
+    # Create comprehensive prompt for translation with emotion detection
+    prompt = f"""You are a professional subtitle translator with expertise in emotion detection and cultural adaptation.
 
-TASK: Translate the attached SRT subtitle file to {target_language_name} and add emotion tags.
+TASK: Translate the subtitles below to {target_language_name} and tag the emotion of each one.
 
 INSTRUCTIONS:
-1. Maintain the EXACT SRT format (sequence numbers, timestamps, blank lines)
+1. Return exactly one record per input subtitle, with the same "id"
 2. Translate ONLY the subtitle text to {target_language_name}
-3. Add emotion tags at the START of each subtitle line in square brackets
+3. Give each subtitle one emotion from the list below
 4. Analyze the emotional tone from context, word choice, punctuation, and content
 5. Preserve line breaks within subtitles
-6. Keep timestamps exactly as they are (do not modify)
+6. Do not merge, split or skip subtitles
 7. Ensure natural, culturally appropriate translations
 8. If subtitle feels less meaningful, make it proper meaningful in the {target_language_name} language.
 9. If there are any idioms and slangs, perserve those in the {target_language_name} language too. 
@@ -235,7 +575,7 @@ INSTRUCTIONS:
     Only correct the original text internally, then translate the corrected word. Do NOT include any gibberish or uncorrected phonetic errors in the final output.
 12. POLYSEMY RESOLUTION (Context-Aware): For any word in the {source_lang} that has multiple possible meanings (polysemy), you MUST choose the definition that is most semantically consistent with the overall topic, subject matter, and the preceding dialogue history. Analyze all previous subtitles in the file to determine the correct context, ensuring that character names, technical terms, and running themes are consistently translated. Do NOT translate based on the most common or literal dictionary definition if it breaks the established flow of the conversation.
 13. CONTEXTUAL LEXICAL OVERRIDE: For Malayalam text, if the word "stick" is used in a sentence referring to a person, its meaning is "body size" or weight gain" (e.g., "bulk up," "put on weight"). NEVER translate "stick" in this context as "wood" or "timber."  
-EMOTION TAGS TO USE:
+EMOTIONS TO USE:
 [neutral] - normal, factual statements
 [happy] - joy, excitement, laughter, positive emotions
 [sad] - sorrow, grief, melancholy, disappointment
@@ -257,70 +597,912 @@ EMOTION TAGS TO USE:
 [hopeful] - optimistic, expectant
 [frustrated] - exasperated, annoyed
 
-EMOTION TAG PLACEMENT:
-- Place emotion tag at the very beginning of the translated text
-- Format: [emotion] Translated text here
-- Example: [happy] This is wonderful news!
+INPUT FORMAT:
+A JSON array of {{"id": <number>, "text": <subtitle text>}} records.
 
 OUTPUT FORMAT:
-Return ONLY the complete SRT content with translations and emotion tags. No explanations, no additional text.
+Return ONLY a JSON array with one record per input subtitle. No explanations, no additional text.
 
 Example format:
-1
-00:00:01,000 --> 00:00:03,500
-[happy] Your translated text here
+[
+ {{"id": 1, "emotion": "happy", "text": "Your translated text here"}},
+ {{"id": 2, "emotion": "serious", "text": "Another translated line"}}
+]
 
-2
-00:00:03,500 --> 00:00:06,000
-[serious] Another translated line
+{context_section}SUBTITLES TO TRANSLATE:
+{cue_records(cues)}"""
+    return prompt
 
-Now translate the attached SRT file."""
+def parse_translation_records(reply: str) -> dict:
+    """
+    {id: "[emotion] text"} for the well-formed records of a model reply.
+    Malformed records are left out; an unknown emotion becomes neutral.
+    """
+    reply = reply.strip()
+    if reply.startswith("```"):
+        reply = reply.strip("`").split("\n", 1)[-1]
+    try:
+        records = json.loads(reply)
+    except ValueError:
+        return {}
+    if isinstance(records, dict):
+        records = records.get("subtitles", records.get("cues", []))
+    translations = {}
+    for record in records if isinstance(records, list) else []:
+        if not isinstance(record, dict):
+            continue
+        cue_id, text, emotion = record.get("id"), record.get("text"), record.get("emotion")
+        if isinstance(cue_id, str) and cue_id.strip().isdigit():
+            cue_id = int(cue_id)
+        if not isinstance(cue_id, int) or not isinstance(text, str) or not text.strip():
+            continue
+        if not isinstance(emotion, str) or emotion.strip().strip("[]").lower() not in SUPPORTED_EMOTIONS:
+            emotion = "neutral"
+        translations[cue_id] = f"[{emotion.strip().strip('[]').lower()}] {text.strip()}"
+    return translations
 
-        # Generate response
-        logger.info("Generating translation with Gemini...")
-        response = model.generate_content([uploaded_file, prompt])
-        
-        # Clean up temporary file and uploaded file
-        os.unlink(temp_srt_path)
-        genai.delete_file(uploaded_file.name)
-        
-        translated_content = response.text.strip()
+def translate_srt_window(model, cues: list, target_lang: str, source_lang: str, context: list = ()) -> list:
+    """
+    Translate one window of cues with the per-cue JSON protocol. Cues that
+    come back missing or malformed are sent again on their own; cue
+    numbers and timestamps always come from the source.
+    """
+    translations = {}
+    pending = list(cues)
+    for attempt in range(1, TRANSLATION_ATTEMPTS + 1):
+        try:
+            with METRICS.stage("gemini_request"):
+                reply = model.generate_content(build_translation_prompt(pending, target_lang, source_lang, context)).text
+        except Exception as e:
+            logger.warning(f"Gemini request failed (attempt {attempt}/{TRANSLATION_ATTEMPTS}): {str(e)}")
+            reply = ""
+        received = parse_translation_records(reply)
+        translations.update((cue["index"], received[cue["index"]]) for cue in pending if cue["index"] in received)
+        pending = [cue for cue in pending if cue["index"] not in translations]
+        if not pending:
+            return [dict(cue, text=translations[cue["index"]]) for cue in cues]
+        logger.warning(
+            f"{len(pending)} of {len(cues)} cues missing or malformed in the reply "
+            f"(attempt {attempt}/{TRANSLATION_ATTEMPTS}); retrying those"
+        )
+    raise Exception(f"Gemini returned no valid translation for cues {', '.join(str(cue['index']) for cue in pending)}")
+
+def normalize_cue_text(text: str) -> str:
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+
+def cue_cache_keys(cues: list, target_lang: str, source_lang: str) -> list:
+    """
+    Cache key per cue: its normalized text plus a hash of the context cues
+    sent with it, the language pair and the prompt version
+    """
+    texts = [normalize_cue_text(cue["text"]) for cue in cues]
+    keys = []
+    for i, text in enumerate(texts):
+        context = "\n".join(texts[max(i - TRANSLATION_CONTEXT_CUES, 0):i])
+        material = "\x1f".join([
+            text, hashlib.sha1(context.encode("utf-8")).hexdigest(),
+            source_lang, target_lang, str(TRANSLATION_PROMPT_VERSION)
+        ])
+        keys.append(hashlib.sha256(material.encode("utf-8")).hexdigest())
+    return keys
+
+class TranslationCache:
+    """Translated cue texts in SQLite, evicted least-recently-used beyond max_entries or after ttl_seconds"""
+
+    def __init__(self, path: str, max_entries: int = TRANSLATION_CACHE_MAX_ENTRIES,
+                 ttl_seconds: float = TRANSLATION_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS cue_translations (
+                key TEXT PRIMARY KEY,
+                translation TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_cue_translations_last_used ON cue_translations(last_used)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_cue_translations_created_at ON cue_translations(created_at)")
+        self.conn.commit()
+        # Counted once here, then kept current from the row counts of each insert and delete
+        self.entries = self.conn.execute("SELECT COUNT(*) FROM cue_translations").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.miss_cues_translated = 0
+        self.miss_seconds = 0.0
+
+    def get_many(self, keys: list) -> dict:
+        """{key: translation} for the keys that are cached and fresh"""
+        now = time.time()
+        found = {}
+        with self.lock:
+            for i in range(0, len(keys), 500):
+                batch = keys[i:i + 500]
+                rows = self.conn.execute(
+                    f"SELECT key, translation, created_at FROM cue_translations WHERE key IN ({','.join('?' * len(batch))})",
+                    batch
+                ).fetchall()
+                for key, translation, created_at in rows:
+                    if now - created_at <= self.ttl_seconds:
+                        found[key] = translation
+            with self.conn:
+                self.conn.executemany("UPDATE cue_translations SET last_used = ? WHERE key = ?",
+                                      [(now, key) for key in found])
+            unique = set(keys)
+            self.hits += len(found)
+            self.misses += len(unique) - len(found)
+        METRICS.inc("translation_cache_lookups_total", len(found), "Cue translation cache lookups", result="hit")
+        METRICS.inc("translation_cache_lookups_total", len(unique) - len(found), "Cue translation cache lookups",
+                    result="miss")
+        return found
+
+    def put_many(self, items: dict, seconds: float = 0.0):
+        """Store {key: translation}; seconds is the model time spent producing them"""
+        now = time.time()
+        with self.lock, self.conn:
+            # Refresh the keys already stored, then add the rest: the insert's row count is the growth
+            self.conn.executemany(
+                "UPDATE cue_translations SET translation = ?, created_at = ?, last_used = ? WHERE key = ?",
+                [(translation, now, now, key) for key, translation in items.items()]
+            )
+            self.entries += self.conn.executemany(
+                "INSERT OR IGNORE INTO cue_translations (key, translation, created_at, last_used) VALUES (?, ?, ?, ?)",
+                [(key, translation, now, now) for key, translation in items.items()]
+            ).rowcount
+            self.miss_cues_translated += len(items)
+            self.miss_seconds += seconds
+            self._evict(now)
+
+    def _evict(self, now: float):
+        expired = self.conn.execute("DELETE FROM cue_translations WHERE created_at < ?",
+                                    (now - self.ttl_seconds,)).rowcount
+        self.entries -= expired
+        trimmed = 0
+        if self.entries > self.max_entries:
+            trimmed = self.conn.execute(
+                "DELETE FROM cue_translations WHERE key IN "
+                "(SELECT key FROM cue_translations ORDER BY last_used LIMIT ?)", (self.entries - self.max_entries,)
+            ).rowcount
+            self.entries -= trimmed
+        self.evictions += expired + trimmed
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            seconds_per_cue = self.miss_seconds / self.miss_cues_translated if self.miss_cues_translated else 0.0
+            return {
+                "entries": self.entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                # Model time the hits would have cost at the average observed per-cue rate
+                "estimated_seconds_saved": self.hits * seconds_per_cue
+            }
+
+TRANSLATION_CACHE = TranslationCache(TRANSLATION_CACHE_PATH) if TRANSLATION_CACHE_PATH else None
+
+def asr_version(engine: str) -> str:
+    """Identifies the ASR setup whose transcripts can be reused"""
+    return SARVAM_MODEL if engine == "sarvam" else f"whisper-{WHISPER_TRANSCRIBE_MODEL}"
+
+class ResultCache:
+    """
+    Two-tier pipeline cache in SQLite. Transcripts are keyed by media
+    content hash plus ASR engine and version; translated SRTs by that
+    transcript key plus target language and prompt version. A new target
+    language for known media therefore skips decoding and ASR.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float = RESULT_CACHE_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS transcripts (
+                content_hash TEXT NOT NULL,
+                engine TEXT NOT NULL,
+                version TEXT NOT NULL,
+                language TEXT NOT NULL,
+                transcript TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (content_hash, engine, version)
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS subtitles (
+                transcript_key TEXT NOT NULL,
+                target_language TEXT NOT NULL,
+                prompt_version INTEGER NOT NULL,
+                srt TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (transcript_key, target_language, prompt_version)
+            )
+        """)
+        self.conn.commit()
+        self.transcript_hits = 0
+        self.srt_hits = 0
+        self.misses = 0
+
+    def get_transcript(self, content_hash: str):
+        """(transcript key, language, transcript) from the current ASR setup, or None"""
+        cutoff = time.time() - self.ttl_seconds
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT engine, version, language, transcript FROM transcripts "
+                "WHERE content_hash = ? AND created_at >= ?", (content_hash, cutoff)
+            ).fetchall()
+        for engine, version, language, transcript in rows:
+            if version == asr_version(engine):
+                return f"{content_hash}:{engine}:{version}", language, json.loads(transcript)
+        return None
+
+    def put_transcript(self, content_hash: str, engine: str, language: str, transcript: dict) -> str:
+        version = asr_version(engine)
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO transcripts VALUES (?, ?, ?, ?, ?, ?)",
+                (content_hash, engine, version, language, json.dumps(transcript, ensure_ascii=False), time.time())
+            )
+            self._evict()
+        return f"{content_hash}:{engine}:{version}"
+
+    def get_srt(self, transcript_key: str, target_language: str):
+        cutoff = time.time() - self.ttl_seconds
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT srt FROM subtitles WHERE transcript_key = ? AND target_language = ? "
+                "AND prompt_version = ? AND created_at >= ?",
+                (transcript_key, target_language, TRANSLATION_PROMPT_VERSION, cutoff)
+            ).fetchone()
+        return row[0] if row else None
+
+    def put_srt(self, transcript_key: str, target_language: str, srt_content: str):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO subtitles VALUES (?, ?, ?, ?, ?)",
+                (transcript_key, target_language, TRANSLATION_PROMPT_VERSION, srt_content, time.time())
+            )
+
+    def record(self, outcome: str):
+        """Count a request served as "srt" (full hit), "transcript" (ASR skipped) or "miss"."""
+        METRICS.inc("result_cache_requests_total", help_text="Subtitle results by cache outcome", outcome=outcome)
+        with self.lock:
+            if outcome == "srt":
+                self.srt_hits += 1
+            elif outcome == "transcript":
+                self.transcript_hits += 1
+            else:
+                self.misses += 1
+
+    def _evict(self):
+        cutoff = time.time() - self.ttl_seconds
+        self.conn.execute("DELETE FROM transcripts WHERE created_at < ?", (cutoff,))
+        self.conn.execute("DELETE FROM subtitles WHERE created_at < ?", (cutoff,))
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "transcripts": self.conn.execute("SELECT COUNT(*) FROM transcripts").fetchone()[0],
+                "subtitles": self.conn.execute("SELECT COUNT(*) FROM subtitles").fetchone()[0],
+                "srt_hits": self.srt_hits,
+                "transcript_hits": self.transcript_hits,
+                "misses": self.misses
+            }
+
+RESULT_CACHE = ResultCache(RESULT_CACHE_PATH) if RESULT_CACHE_PATH else None
+
+def translate_srt_with_gemini(srt_content: str, target_lang: str, source_lang: str = "auto",
+                              model=None, cache: TranslationCache = None) -> str:
+    """
+    Translate an SRT file using Gemini API with emotion detection
+    Cues already in the translation cache are reused. The rest are split
+    into windows of TRANSLATION_WINDOW_CUES, each sent with a few
+    preceding cues as context, and translated concurrently.
+    model defaults to create_translation_model(); anything with a
+    generate_content(prompt) method returning an object with .text works.
+    cache defaults to TRANSLATION_CACHE.
+    """
+    if not srt_content.strip():
+        return srt_content
+    
+    try:
+        cues = parse_srt(srt_content)
+        if not cues:
+            raise Exception("Input does not contain valid SRT cues")
+        cache = cache or TRANSLATION_CACHE
+        keys = cue_cache_keys(cues, target_lang, source_lang)
+        cached = cache.get_many(keys) if cache else {}
+        missing = [i for i, key in enumerate(keys) if key not in cached]
         
-        # Validate the response has SRT structure
-        if "-->" not in translated_content:
-            raise Exception("Gemini response does not contain valid SRT format")
+        translated = {i: dict(cue, text=cached[keys[i]]) for i, cue in enumerate(cues) if keys[i] in cached}
+        if missing:
+            model = model or create_translation_model()
+            windows = [missing[i:i + TRANSLATION_WINDOW_CUES] for i in range(0, len(missing), TRANSLATION_WINDOW_CUES)]
+            logger.info(f"Translating {len(missing)} of {len(cues)} cues to {target_lang} "
+                        f"in {len(windows)} window(s) ({len(cues) - len(missing)} cached)...")
+            started = time.time()
+            with METRICS.stage("translate"), ThreadPoolExecutor(max_workers=min(TRANSLATION_CONCURRENCY, len(windows))) as pool:
+                # Each window runs in a copy of this context so its stage timings reach the request
+                parts = [future.result() for future in [
+                    pool.submit(
+                        contextvars.copy_context().run, translate_srt_window,
+                        model, [cues[i] for i in window], target_lang, source_lang,
+                        cues[max(window[0] - TRANSLATION_CONTEXT_CUES, 0):window[0]]
+                    )
+                    for window in windows
+                ]]
+            for window, part in zip(windows, parts):
+                translated.update(zip(window, part))
+            if cache:
+                cache.put_many({keys[i]: translated[i]["text"] for i in missing}, time.time() - started)
+        else:
+            logger.info(f"All {len(cues)} cues served from the translation cache")
         
         logger.info("Translation with emotions completed successfully")
-        return translated_content
+        return format_srt([translated[i] for i in range(len(cues))])
         
     except Exception as e:
         logger.error(f"Gemini translation failed: {str(e)}")
-        # Clean up on error
-        if 'temp_srt_path' in locals() and os.path.exists(temp_srt_path):
-            os.unlink(temp_srt_path)
-        if 'uploaded_file' in locals():
-            try:
-                genai.delete_file(uploaded_file.name)
-            except:
-                pass
         raise Exception(f"Gemini translation failed: {str(e)}")
 
-def extract_audio_from_video(video_path: str) -> str:
-    """Extract audio from video file and return audio file path"""
-    with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as temp_audio:
-        audio_path = temp_audio.name
-    
+def decode_audio(media_path: str) -> np.ndarray:
+    """
+    Decode the audio track of an audio or video file, once, straight to
+    16 kHz mono float32 PCM. The array feeds both language detection and
+    Whisper transcription.
+    """
     try:
-        video = VideoFileClip(video_path)
-        video.audio.write_audiofile(audio_path, verbose=False, logger=None)
-        video.close()
-        return audio_path
+        with METRICS.stage("decode"):
+            audio = whisper.load_audio(media_path)
+        METRICS.inc("media_seconds_processed_total", len(audio) / WHISPER_SAMPLE_RATE, "Seconds of media decoded")
+        return audio
     except Exception as e:
         logger.error(f"Audio extraction failed: {str(e)}")
-        if os.path.exists(audio_path):
-            os.unlink(audio_path)
         raise Exception(f"Audio extraction failed: {str(e)}")
 
+def write_wav(audio: np.ndarray) -> str:
+    """Write decoded audio to a temporary 16-bit WAV file (lossless) and return its path"""
+    with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_wav:
+        wav_path = temp_wav.name
+    pcm = (np.clip(audio, -1.0, 1.0) * 32767).astype("<i2")
+    with wave.open(wav_path, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(WHISPER_SAMPLE_RATE)
+        wav.writeframes(pcm.tobytes())
+    return wav_path
+
+async def save_upload(file: UploadFile, directory: str = None) -> tuple:
+    """Stream an upload to a temporary file keeping its extension; return (path, sha256 hex)"""
+    suffix = os.path.splitext(file.filename)[1].lower() or ".mp3"
+    with tempfile.NamedTemporaryFile(suffix=suffix, dir=directory, delete=False) as temp_upload:
+        upload_path = temp_upload.name
+    with METRICS.stage("upload"):
+        upload_size, content_hash = await stream_upload(file, upload_path)
+    logger.info(f"Received {upload_size} bytes (sha256 {content_hash})")
+    return upload_path, content_hash
+
+def parse_srt(srt_content: str) -> list:
+    """Parse SRT text into cues: [{"index", "start", "end", "text"}]"""
+    cues = []
+    for block in srt_content.replace("\r\n", "\n").strip().split("\n\n"):
+        lines = block.strip().split("\n")
+        if len(lines) < 2 or "-->" not in lines[1]:
+            continue
+        start, end = (part.strip() for part in lines[1].split("-->", 1))
+        cues.append({
+            "index": int(lines[0]) if lines[0].strip().isdigit() else len(cues) + 1,
+            "start": start,
+            "end": end,
+            "text": "\n".join(lines[2:]).strip()
+        })
+    return cues
+
+def transcribe_window(audio: np.ndarray, start: int, end: int, language: str) -> dict:
+    """Transcribe audio[start:end] with the engine for its language, on the full-file timeline"""
+    offset = start / WHISPER_SAMPLE_RATE
+    if language in INDIAN_LANGUAGES:
+        wav_path = write_wav(audio[start:end])
+        try:
+            entries = process_with_sarvam(wav_path)["diarized_transcript"]["entries"]
+        finally:
+            os.unlink(wav_path)
+        for entry in entries:
+            entry["start_time_seconds"] += offset
+            entry["end_time_seconds"] += offset
+    else:
+        with METRICS.stage("whisper"):
+            segments = transcribe_chunk(audio[start:end], language, offset)
+        entries = [
+            {
+                "start_time_seconds": segment["start"],
+                "end_time_seconds": segment["end"],
+                "transcript": segment["text"].strip()
+            }
+            for segment in segments
+        ]
+    return {"diarized_transcript": {"entries": entries}}
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def audio_window_transcripts(audio: np.ndarray, language: str):
+    """Transcripts of successive STREAM_WINDOW_SECONDS windows; the next window is transcribed while the caller works"""
+    windows = split_on_silence(audio, STREAM_WINDOW_SECONDS)
+    pending = None
+    try:
+        for i, (start, end) in enumerate(windows):
+            if pending is None:
+                pending = asyncio.ensure_future(asyncio.to_thread(transcribe_window, audio, start, end, language))
+            transcript = await pending
+            pending = None
+            if i + 1 < len(windows):
+                pending = asyncio.ensure_future(asyncio.to_thread(transcribe_window, audio, *windows[i + 1], language))
+            yield transcript
+    finally:
+        if pending is not None:
+            pending.cancel()
+
+async def cached_window_transcripts(transcript: dict):
+    """A cached transcript regrouped into STREAM_WINDOW_SECONDS windows"""
+    window, window_end = [], STREAM_WINDOW_SECONDS
+    for entry in transcript["diarized_transcript"]["entries"]:
+        if window and entry["start_time_seconds"] >= window_end:
+            yield {"diarized_transcript": {"entries": window}}
+            window = []
+        while entry["start_time_seconds"] >= window_end:
+            window_end += STREAM_WINDOW_SECONDS
+        window.append(entry)
+    if window:
+        yield {"diarized_transcript": {"entries": window}}
+
+def cue_event(cue: dict, index: int) -> str:
+    cue = dict(cue, index=index)
+    cue["srt"] = f"{index}\n{cue['start']} --> {cue['end']}\n{cue['text']}\n"
+    return sse_event("cue", cue)
+
+async def subtitle_events(upload_path: str, content_hash: str, target_language: str):
+    """
+    Server-sent events for a streamed subtitle job. The timeline is cut at
+    silences into STREAM_WINDOW_SECONDS windows; each window is transcribed
+    while the previous one is being translated, and its translated cues are
+    sent as soon as they are ready. Results already in RESULT_CACHE are
+    replayed, and a finished stream is stored there.
+    """
+    windows = None
+    try:
+        hit = await asyncio.to_thread(RESULT_CACHE.get_transcript, content_hash) if RESULT_CACHE else None
+        if hit:
+            transcript_key, detected_language, transcript = hit
+            cached_srt = RESULT_CACHE.get_srt(transcript_key, target_language)
+            RESULT_CACHE.record("srt" if cached_srt is not None else "transcript")
+            yield sse_event("language", {"source_language": detected_language, "target_language": target_language})
+            if cached_srt is not None:
+                cues = parse_srt(cached_srt)
+                for index, cue in enumerate(cues, 1):
+                    yield cue_event(cue, index)
+                yield sse_event("done", {"cues": len(cues)})
+                return
+            windows = cached_window_transcripts(transcript)
+        else:
+            if RESULT_CACHE:
+                RESULT_CACHE.record("miss")
+            audio = await asyncio.to_thread(decode_audio, upload_path)
+            detected_language = await asyncio.to_thread(detect_language, audio)
+            yield sse_event("language", {"source_language": detected_language, "target_language": target_language})
+            windows = audio_window_transcripts(audio, detected_language)
+        
+        entries, translated_cues = [], []
+        async for transcript in windows:
+            entries.extend(transcript["diarized_transcript"]["entries"])
+            srt_content = convert_json_to_srt(transcript)
+            if not srt_content.strip():
+                continue
+            translated_srt = await asyncio.to_thread(translate_srt_with_gemini, srt_content, target_language, detected_language)
+            for cue in parse_srt(translated_srt):
+                translated_cues.append(dict(cue, index=len(translated_cues) + 1))
+                yield cue_event(cue, len(translated_cues))
+        yield sse_event("done", {"cues": len(translated_cues)})
+        
+        if RESULT_CACHE:
+            if not hit:
+                engine = "sarvam" if detected_language in INDIAN_LANGUAGES else "whisper"
+                transcript_key = RESULT_CACHE.put_transcript(
+                    content_hash, engine, detected_language, {"diarized_transcript": {"entries": entries}}
+                )
+            RESULT_CACHE.put_srt(transcript_key, target_language, format_srt(translated_cues))
+    except Exception as e:
+        logger.error(f"Streaming subtitles failed: {str(e)}")
+        yield sse_event("error", {"detail": f"Processing failed: {str(e)}"})
+    finally:
+        if windows is not None:
+            await windows.aclose()
+        if os.path.exists(upload_path):
+            os.unlink(upload_path)
+
+def is_video_file(filename: str) -> bool:
+    return filename.lower().endswith(('.mp4', '.avi', '.mov', '.mkv', '.webm', '.flv', '.wmv', '.m4v'))
+
+def transcribe_media(upload_path: str, is_video: bool) -> tuple:
+    """Decode, detect the language and transcribe; return (language, engine, transcript)"""
+    temp_wav_path = None
+    try:
+        # Decode the audio track once; detection and transcription share it
+        logger.info(f"Decoding audio from {'video' if is_video else 'audio'} file...")
+        audio = decode_audio(upload_path)
+        
+        # Detect language
+        logger.info("Detecting audio language...")
+        detected_language = detect_language(audio)
+        logger.info(f"Detected language: {detected_language}")
+        
+        # Process with the model for that language
+        if detected_language in INDIAN_LANGUAGES:
+            logger.info("Using Sarvam AI for Indian language transcription")
+            # Sarvam takes a file: audio uploads go as-is, video audio as lossless WAV
+            if is_video:
+                temp_wav_path = write_wav(audio)
+            return detected_language, "sarvam", process_with_sarvam(temp_wav_path or upload_path)
+        logger.info("Using Whisper for transcription")
+        return detected_language, "whisper", process_with_whisper(audio, detected_language)
+    finally:
+        if temp_wav_path and os.path.exists(temp_wav_path):
+            os.unlink(temp_wav_path)
+
+def cached_transcript(upload_path: str, content_hash: str, is_video: bool) -> tuple:
+    """
+    Transcript for the upload, from RESULT_CACHE when possible.
+    Returns (transcript key or None, language, transcript, whether it was cached)
+    """
+    hit = RESULT_CACHE.get_transcript(content_hash) if RESULT_CACHE else None
+    if hit:
+        logger.info(f"Transcript for {content_hash[:12]} served from the result cache")
+        transcript_key, detected_language, result = hit
+        return transcript_key, detected_language, result, True
+    detected_language, engine, result = transcribe_media(upload_path, is_video)
+    transcript_key = RESULT_CACHE.put_transcript(content_hash, engine, detected_language, result) if RESULT_CACHE else None
+    return transcript_key, detected_language, result, False
+
+def parse_target_languages(target_language: str) -> list:
+    """Comma-separated language codes, de-duplicated in order"""
+    targets = list(dict.fromkeys(code.strip() for code in target_language.split(",") if code.strip()))
+    if not targets:
+        raise HTTPException(status_code=400, detail="target_language is required")
+    if len(targets) > MAX_TARGET_LANGUAGES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_TARGET_LANGUAGES} target languages per request")
+    return targets
+
+def translate_targets(transcript_key, result: dict, detected_language: str, targets: list,
+                      transcript_cached: bool, on_translated=None) -> dict:
+    """
+    Translate one transcript into every target language, reusing cached
+    SRTs and running up to TARGET_LANGUAGE_CONCURRENCY languages at once.
+    on_translated(language, srt) is called as each language finishes.
+    Returns {language: (srt, cache outcome)}.
+    """
+    srt_content = None
+    outputs = {}
+    for target in targets:
+        cached_srt = RESULT_CACHE.get_srt(transcript_key, target) if transcript_key else None
+        if cached_srt is not None:
+            outputs[target] = (cached_srt, "srt")
+    missing = [target for target in targets if target not in outputs]
+    if missing:
+        # Convert to SRT
+        logger.info("Converting to SRT format...")
+        srt_content = convert_json_to_srt(result)
+        
+        # Translate to each target language with emotion detection using Gemini
+        logger.info(f"Translating from {detected_language} to {', '.join(missing)} with emotion detection...")
+        def translate(target):
+            translated_srt = translate_srt_with_gemini(srt_content, target, detected_language)
+            if on_translated:
+                on_translated(target, translated_srt)
+            return translated_srt
+        
+        with ThreadPoolExecutor(max_workers=min(TARGET_LANGUAGE_CONCURRENCY, len(missing))) as pool:
+            futures = [pool.submit(contextvars.copy_context().run, translate, target) for target in missing]
+            translated = [future.result() for future in futures]
+        for target, translated_srt in zip(missing, translated):
+            outputs[target] = (translated_srt, "transcript" if transcript_cached else "miss")
+            if transcript_key:
+                RESULT_CACHE.put_srt(transcript_key, target, translated_srt)
+    if RESULT_CACHE:
+        for _, outcome in outputs.values():
+            RESULT_CACHE.record(outcome)
+    return {target: outputs[target] for target in targets}
+
+def subtitle_filename(target_language: str) -> str:
+    return f"subtitles_{target_language}_with_emotions.srt"
+
+def subtitle_response(detected_language: str, subtitles: dict, headers: dict = None) -> Response:
+    """The SRT for one language, or a zip of one SRT per language"""
+    headers = dict(headers or {}, **{"X-Source-Language": detected_language, "X-Target-Language": ",".join(subtitles)})
+    if len(subtitles) == 1:
+        (target, translated_srt), = subtitles.items()
+        return Response(
+            content=translated_srt,
+            media_type="application/x-subrip",
+            headers=dict(headers, **{"Content-Disposition": f"attachment; filename={subtitle_filename(target)}"})
+        )
+    
+    bundle = io.BytesIO()
+    with zipfile.ZipFile(bundle, "w", zipfile.ZIP_DEFLATED) as archive:
+        for target, translated_srt in subtitles.items():
+            archive.writestr(subtitle_filename(target), translated_srt)
+    return Response(
+        content=bundle.getvalue(),
+        media_type="application/zip",
+        headers=dict(headers, **{"Content-Disposition": "attachment; filename=subtitles_with_emotions.zip"})
+    )
+
+class JobLeaseLost(Exception):
+    """Another worker process has taken over the job"""
+
+class SubtitleJobs:
+    """
+    Subtitle jobs persisted in SQLite and run on a thread pool, off the
+    event loop. Every finished stage is checkpointed on the job row (the
+    transcript, then each translated language).
+
+    Each row is leased to the process running it, which renews the lease
+    while it works. Jobs whose lease runs out, because their process
+    crashed or restarted, are claimed by whichever process sharing the
+    store notices first and resume from their last checkpoint; jobs a
+    live sibling is still running are left alone.
+    """
+
+    def __init__(self, path: str = SUBTITLE_JOB_DB, directory: str = SUBTITLE_JOB_DIR,
+                 workers: int = SUBTITLE_JOB_WORKERS, lease_seconds: float = SUBTITLE_JOB_LEASE_SECONDS):
+        self.directory = directory
+        self.workers = workers
+        self.lease_seconds = lease_seconds
+        self.owner = None
+        self.pool = None
+        self.leases = None
+        self.tasks = {}
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS subtitle_jobs (
+                job_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                upload_path TEXT,
+                content_hash TEXT NOT NULL,
+                targets TEXT NOT NULL,
+                source_language TEXT,
+                transcript_key TEXT,
+                transcript TEXT,
+                subtitles TEXT NOT NULL DEFAULT '{}',
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                owner TEXT,
+                lease_expires REAL
+            )
+        """)
+        # Stores created before leases existed
+        columns = {row["name"] for row in self.conn.execute("PRAGMA table_info(subtitle_jobs)")}
+        for column, kind in (("owner", "TEXT"), ("lease_expires", "REAL")):
+            if column not in columns:
+                self.conn.execute(f"ALTER TABLE subtitle_jobs ADD COLUMN {column} {kind}")
+        self.conn.commit()
+
+    def start(self):
+        # Set here rather than in __init__, so every forked server worker gets its own identity
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        os.makedirs(self.directory, exist_ok=True)
+        self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="subtitle-job")
+        self._prune()
+        self._resume(self._claim_expired())
+        self.leases = asyncio.create_task(self._keep_leases())
+
+    def stop(self):
+        if self.leases is not None:
+            self.leases.cancel()
+            self.leases = None
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
+    def _claim_expired(self) -> list:
+        """Take over unfinished jobs whose lease has run out; return the ids this process owns."""
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE subtitle_jobs SET owner = ?, lease_expires = ? WHERE status IN ('queued', 'running') "
+                "AND (lease_expires IS NULL OR lease_expires < ?)",
+                (self.owner, now + self.lease_seconds, now)
+            )
+            return [row["job_id"] for row in self.conn.execute(
+                "SELECT job_id FROM subtitle_jobs WHERE owner = ? AND status IN ('queued', 'running') "
+                "ORDER BY created_at", (self.owner,)
+            )]
+
+    def _renew_leases(self):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE subtitle_jobs SET lease_expires = ? WHERE owner = ? AND status IN ('queued', 'running')",
+                (time.time() + self.lease_seconds, self.owner)
+            )
+
+    def _resume(self, job_ids: list):
+        for job_id in job_ids:
+            if job_id not in self.tasks:
+                logger.info(f"Resuming subtitle job {job_id}")
+                self._launch(job_id)
+
+    async def _keep_leases(self):
+        """Heartbeat: renew this process's leases and pick up jobs orphaned by other processes."""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                await asyncio.to_thread(self._renew_leases)
+                self._resume(await asyncio.to_thread(self._claim_expired))
+            except Exception as e:
+                logger.warning(f"Subtitle job lease upkeep failed: {str(e)}")
+
+    def _get(self, job_id: str):
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM subtitle_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def _update(self, job_id: str, **fields):
+        """Update a job this process holds; raises JobLeaseLost if another process has taken it."""
+        fields["updated_at"] = time.time()
+        with self.lock, self.conn:
+            updated = self.conn.execute(
+                f"UPDATE subtitle_jobs SET {', '.join(f'{name} = ?' for name in fields)} "
+                "WHERE job_id = ? AND owner = ?",
+                (*fields.values(), job_id, self.owner)
+            ).rowcount
+        if not updated:
+            raise JobLeaseLost(f"Subtitle job {job_id} is no longer held by this process")
+
+    def _prune(self):
+        """Forget finished jobs older than SUBTITLE_JOB_RETENTION_SECONDS."""
+        with self.lock, self.conn:
+            self.conn.execute(
+                "DELETE FROM subtitle_jobs WHERE status IN ('done', 'failed') AND updated_at < ?",
+                (time.time() - SUBTITLE_JOB_RETENTION_SECONDS,)
+            )
+
+    def pending(self) -> int:
+        return len(self.tasks)
+
+    async def submit(self, file: UploadFile, targets: list) -> str:
+        if self.pending() >= SUBTITLE_JOB_MAX_PENDING:
+            raise HTTPException(status_code=503, detail="Too many subtitle jobs in progress, retry later",
+                                headers={"Retry-After": "30"})
+        upload_path, content_hash = await save_upload(file, self.directory)
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO subtitle_jobs (job_id, status, stage, filename, upload_path, content_hash, "
+                "targets, created_at, updated_at, owner, lease_expires) "
+                "VALUES (?, 'queued', 'queued', ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, file.filename, upload_path, content_hash, json.dumps(targets), now, now,
+                 self.owner, now + self.lease_seconds)
+            )
+        self._prune()
+        self._launch(job_id)
+        return job_id
+
+    def _launch(self, job_id: str):
+        self.tasks[job_id] = asyncio.create_task(self._run(job_id))
+
+    async def _run(self, job_id: str):
+        loop = asyncio.get_running_loop()
+        try:
+            if profile_requested():
+                # Started by an X-Profile request: sample the job, which outlives that request
+                await loop.run_in_executor(self.pool, call_profiled, f"subtitle-job-{job_id}", self._process, job_id)
+            else:
+                await loop.run_in_executor(self.pool, self._process, job_id)
+        except JobLeaseLost:
+            logger.warning(f"Subtitle job {job_id} was taken over by another worker; stopping here")
+        except Exception as e:
+            logger.error(f"Subtitle job {job_id} failed: {str(e)}")
+            try:
+                self._update(job_id, status="failed", stage="failed", error=str(e))
+                self._discard_upload(job_id)
+            except JobLeaseLost:
+                pass
+        finally:
+            self.tasks.pop(job_id, None)
+
+    def _process(self, job_id: str):
+        """Run the remaining stages of a job; called on a worker thread."""
+        job = self._get(job_id)
+        self._update(job_id, status="running", attempts=job["attempts"] + 1)
+        targets = json.loads(job["targets"])
+        
+        if job["transcript"] is None:
+            self._update(job_id, stage="transcribing")
+            transcript_key, detected_language, transcript, transcript_cached = cached_transcript(
+                job["upload_path"], job["content_hash"], is_video_file(job["filename"])
+            )
+            self._update(job_id, source_language=detected_language, transcript_key=transcript_key,
+                         transcript=json.dumps(transcript, ensure_ascii=False))
+        else:
+            # Restored from this job's checkpoint: ASR was skipped on this run
+            transcript_key, detected_language = job["transcript_key"], job["source_language"]
+            transcript = json.loads(job["transcript"])
+            transcript_cached = True
+        
+        subtitles = json.loads(job["subtitles"])
+        remaining = [target for target in targets if target not in subtitles]
+        if remaining:
+            self._update(job_id, stage="translating")
+            lock = threading.Lock()
+            
+            def checkpoint(target, translated_srt):
+                with lock:
+                    subtitles[target] = translated_srt
+                    self._update(job_id, subtitles=json.dumps(subtitles, ensure_ascii=False))
+            
+            for target, (translated_srt, _) in translate_targets(
+                transcript_key, transcript, detected_language, remaining, transcript_cached,
+                on_translated=checkpoint
+            ).items():
+                subtitles[target] = translated_srt
+        
+        self._update(job_id, status="done", stage="done", subtitles=json.dumps(subtitles, ensure_ascii=False))
+        self._discard_upload(job_id)
+
+    def _discard_upload(self, job_id: str):
+        job = self._get(job_id)
+        if job and job["upload_path"] and os.path.exists(job["upload_path"]):
+            os.unlink(job["upload_path"])
+        self._update(job_id, upload_path=None)
+
+    def status(self, job_id: str) -> dict:
+        job = self._get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Unknown job id")
+        targets = json.loads(job["targets"])
+        return {
+            "job_id": job_id,
+            "status": job["status"],
+            "stage": job["stage"],
+            "source_language": job["source_language"],
+            "target_languages": targets,
+            "completed_languages": [target for target in targets if target in json.loads(job["subtitles"])],
+            "error": job["error"],
+            "attempts": job["attempts"],
+            "created_at": job["created_at"],
+            "updated_at": job["updated_at"],
+            "queue_depth": self.pending()
+        }
+
+    def result(self, job_id: str):
+        """(source language, {language: srt}) of a finished job"""
+        job = self._get(job_id)
+        subtitles = json.loads(job["subtitles"])
+        return job["source_language"], {target: subtitles[target] for target in json.loads(job["targets"])}
+
+SUBTITLE_JOBS = SubtitleJobs()
+
+# Scrape-time gauges
+METRICS.gauge("subtitle_jobs_pending", SUBTITLE_JOBS.pending, "Subtitle jobs queued or running")
+METRICS.gauge("sarvam_files_waiting", lambda: SARVAM_BATCHER.stats()["waiting"], "Files waiting for the next Sarvam batch")
+METRICS.gauge("sarvam_batch_jobs", lambda: SARVAM_BATCHER.stats()["jobs"], "Sarvam batch jobs submitted")
+METRICS.gauge("whisper_models_loaded", lambda: len(WHISPER_MODELS.models), "Whisper models held in memory")
+if TRANSLATION_CACHE:
+    METRICS.gauge("translation_cache_entries", lambda: TRANSLATION_CACHE.entries, "Cached cue translations")
+
 @app.post("/generate-subtitles")
 async def generate_subtitles(
     file: UploadFile = File(...),
@@ -332,85 +1514,45 @@ async def generate_subtitles(
     
     Parameters:
     - file: Audio or video file (mp3, wav, mp4, avi, mov, mkv, etc.)
-    - target_language: Language code for translation (e.g., "es", "fr", "de", "hi", "en")
+    - target_language: Language code for translation (e.g., "es", "fr", "de", "hi", "en"),
+      or several comma-separated codes (e.g., "es,fr,de")
     
     Returns:
-    - SRT subtitle file with translations and emotion tags
+    - SRT subtitle file with translations and emotion tags, or a zip of one
+      SRT per language when several languages were requested
     """
     logger.info(f"Received request - Target language: {target_language}")
     
-    temp_file_path = None
-    temp_audio_path = None
-    temp_video_path = None
+    upload_path = None
     
     try:
         # Validate Gemini API key
-        if not GEMINI_API_KEY:
+        if not GEMINI_API_KEY and not GEMINI_FAKE:
             raise HTTPException(status_code=500, detail="GEMINI_API_KEY not configured in .env file")
+        targets = parse_target_languages(target_language)
         
-        # Read uploaded file content
-        file_content = await file.read()
-        
-        # Check if it's a video file
-        is_video = file.filename.lower().endswith(('.mp4', '.avi', '.mov', '.mkv', '.webm', '.flv', '.wmv', '.m4v'))
-        
-        if is_video:
-            logger.info(f"Processing video file: {file.filename}")
-            # Create temp video file
-            with tempfile.NamedTemporaryFile(suffix=".mp4", delete=False) as temp_video:
-                temp_video.write(file_content)
-                temp_video_path = temp_video.name
-            
-            # Extract audio from video
-            logger.info("Extracting audio from video...")
-            temp_audio_path = extract_audio_from_video(temp_video_path)
-            temp_file_path = temp_audio_path
-            
-            # Cleanup temp video file
-            os.unlink(temp_video_path)
-            temp_video_path = None
-        else:
-            logger.info(f"Processing audio file: {file.filename}")
-            # Create temp audio file directly
-            with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as temp_audio:
-                temp_audio.write(file_content)
-                temp_file_path = temp_audio.name
-        
-        # Detect language
-        logger.info("Detecting audio language...")
-        detected_language = detect_language(temp_file_path)
-        logger.info(f"Detected language: {detected_language}")
+        # Stream the upload to disk instead of holding it in memory
+        upload_path, content_hash = await save_upload(file)
+        logger.info(f"Processing {'video' if is_video_file(file.filename) else 'audio'} file: {file.filename}")
         
-        # Determine which model to use
-        use_sarvam = detected_language in INDIAN_LANGUAGES
+        # Transcript from the result cache, or decode + detect + ASR; the
+        # blocking stages run in threads so other requests keep being served
+        transcript_key, detected_language, result, transcript_cached = await asyncio.to_thread(
+            cached_transcript, upload_path, content_hash, is_video_file(file.filename)
+        )
+        outputs = await asyncio.to_thread(
+            translate_targets, transcript_key, result, detected_language, targets, transcript_cached
+        )
+        logger.info(f"Successfully generated subtitles in: {', '.join(targets)}")
         
-        # Process with appropriate model
-        if use_sarvam:
-            logger.info("Using Sarvam AI for Indian language transcription")
-            result = process_with_sarvam(temp_file_path)
+        if len(targets) == 1:
+            cache_header = outputs[targets[0]][1]
         else:
-            logger.info("Using Whisper for transcription")
-            result = process_with_whisper(temp_file_path, detected_language)
-        
-        # Convert to SRT
-        logger.info("Converting to SRT format...")
-        srt_content = convert_json_to_srt(result)
-        
-        # Translate to target language with emotion detection using Gemini
-        logger.info(f"Translating from {detected_language} to {target_language} with emotion detection...")
-        translated_srt = translate_srt_with_gemini(srt_content, target_language, detected_language)
-        
-        filename = f"subtitles_{target_language}_with_emotions.srt"
-        logger.info(f"Successfully generated subtitles: {filename}")
-        
-        return Response(
-            content=translated_srt,
-            media_type="application/x-subrip",
-            headers={
-                "Content-Disposition": f"attachment; filename={filename}",
-                "X-Source-Language": detected_language,
-                "X-Target-Language": target_language
-            }
+            cache_header = ",".join(f"{target}={outcome}" for target, (_, outcome) in outputs.items())
+        return subtitle_response(
+            detected_language,
+            {target: translated_srt for target, (translated_srt, _) in outputs.items()},
+            {"X-Cache": cache_header}
         )
         
     except HTTPException:
@@ -420,12 +1562,53 @@ async def generate_subtitles(
         raise HTTPException(status_code=500, detail=f"Processing failed: {str(e)}")
     finally:
         # Cleanup temp files
-        if temp_file_path and os.path.exists(temp_file_path):
-            os.unlink(temp_file_path)
-        if temp_audio_path and temp_audio_path != temp_file_path and os.path.exists(temp_audio_path):
-            os.unlink(temp_audio_path)
-        if temp_video_path and os.path.exists(temp_video_path):
-            os.unlink(temp_video_path)
+        if upload_path and os.path.exists(upload_path):
+            os.unlink(upload_path)
+
+@app.post("/generate-subtitles/stream")
+async def generate_subtitles_stream(
+    file: UploadFile = File(...),
+    target_language: str = Form(...)
+):
+    """
+    Same pipeline as /generate-subtitles, streamed as server-sent events:
+    a "language" event, then one "cue" event per translated, emotion-tagged
+    cue as each window of the timeline is finished, then "done" (or "error").
+    """
+    logger.info(f"Received streaming request - Target language: {target_language}")
+    if not GEMINI_API_KEY and not GEMINI_FAKE:
+        raise HTTPException(status_code=500, detail="GEMINI_API_KEY not configured in .env file")
+    upload_path, content_hash = await save_upload(file)
+    return StreamingResponse(
+        subtitle_events(upload_path, content_hash, target_language),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/jobs/subtitles", status_code=202)
+async def submit_subtitle_job(
+    file: UploadFile = File(...),
+    target_language: str = Form(...)
+):
+    """Queue a subtitle job (same form as /generate-subtitles) and return its job id immediately."""
+    if not GEMINI_API_KEY and not GEMINI_FAKE:
+        raise HTTPException(status_code=500, detail="GEMINI_API_KEY not configured in .env file")
+    job_id = await SUBTITLE_JOBS.submit(file, parse_target_languages(target_language))
+    return SUBTITLE_JOBS.status(job_id)
+
+@app.get("/jobs/{job_id}")
+async def subtitle_job_status(job_id: str):
+    return SUBTITLE_JOBS.status(job_id)
+
+@app.get("/jobs/{job_id}/result")
+async def subtitle_job_result(job_id: str):
+    """Subtitles of a finished job; 202 with the status while it is still pending."""
+    info = SUBTITLE_JOBS.status(job_id)
+    if info["status"] in ("queued", "running"):
+        return JSONResponse(status_code=202, content=info)
+    if info["status"] == "failed":
+        raise HTTPException(status_code=500, detail=f"Processing failed: {info['error']}")
+    return subtitle_response(*SUBTITLE_JOBS.result(job_id))
 
 @app.get("/")
 async def root():
@@ -440,21 +1623,32 @@ async def root():
             "Support for audio and video files"
         ],
         "endpoint": "/generate-subtitles",
-        "supported_emotions": [
-            "neutral", "happy", "sad", "angry", "surprised", "fearful",
-            "disgusted", "confused", "excited", "calm", "sarcastic",
-            "serious", "playful", "romantic", "apologetic", "grateful",
-            "proud", "concerned", "hopeful", "frustrated"
-        ]
+        "streaming_endpoint": "/generate-subtitles/stream",
+        "job_endpoint": "/jobs/subtitles",
+        "supported_emotions": SUPPORTED_EMOTIONS
     }
 
+@app.on_event("startup")
+def startup_event():
+    SUBTITLE_JOBS.start()
+
+@app.on_event("shutdown")
+def shutdown_event():
+    SUBTITLE_JOBS.stop()
+    if TRANSCRIBE_POOL is not None:
+        TRANSCRIBE_POOL.shutdown(cancel_futures=True)
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
     return {
         "status": "healthy",
         "gemini_configured": bool(GEMINI_API_KEY),
-        "sarvam_configured": bool(SARVAM_API_KEY)
+        "sarvam_configured": bool(SARVAM_API_KEY),
+        "sarvam_batches": SARVAM_BATCHER.stats(),
+        "whisper_models_loaded": sorted(WHISPER_MODELS.models),
+        "translation_cache": TRANSLATION_CACHE.stats() if TRANSLATION_CACHE else None,
+        "result_cache": RESULT_CACHE.stats() if RESULT_CACHE else None
     }
 
 if __name__ == "__main__":
@@ -0,0 +1,25 @@
+import importlib.util
+import os
+import sys
+import tempfile
+
+import pytest
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The backend modules (uploads, fakes, ...) import each other as top-level modules
+sys.path.insert(0, BACKEND)
+
+@pytest.fixture(scope="session")
+def server():
+    """The subtitle service module, imported in a temporary directory so its stores land there"""
+    os.environ["TRANSLATION_CACHE_PATH"] = ""  # tests that cache pass their own
+    # Loaded by path: "test" would otherwise resolve to the standard library package
+    spec = importlib.util.spec_from_file_location("subtitle_server", os.path.join(BACKEND, "test.py"))
+    module = importlib.util.module_from_spec(spec)
+    cwd = os.getcwd()
+    os.chdir(tempfile.mkdtemp(prefix="subtitle-tests-"))
+    try:
+        spec.loader.exec_module(module)
+    finally:
+        os.chdir(cwd)
+    return module
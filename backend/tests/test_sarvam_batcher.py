@@ -0,0 +1,73 @@
+import threading
+import time
+import wave
+
+import pytest
+
+from fakes import FakeSarvamAI
+
+def write_wav(path, seconds):
+    with wave.open(str(path), "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(16000)
+        wav.writeframes(b"\0\0" * int(16000 * seconds))
+    return str(path)
+
+@pytest.fixture
+def wavs(tmp_path):
+    """Three files of different lengths, so each output can be told apart"""
+    return [write_wav(tmp_path / f"clip{i}.wav", 2.5 * i) for i in range(1, 4)]
+
+def transcribe_concurrently(batcher, paths, timeout=10):
+    """{path: output or exception} from one transcribe() call per path, all in flight at once"""
+    results = {}
+
+    def call(path):
+        try:
+            results[path] = batcher.transcribe(path)
+        except Exception as e:
+            results[path] = e
+
+    threads = [threading.Thread(target=call, args=(path,)) for path in paths]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout)
+    assert len(results) == len(paths), "callers still waiting"
+    return results
+
+def batcher_for(server, client, window_seconds, max_files):
+    return server.SarvamBatcher(lambda: client, window_seconds=window_seconds, max_files=max_files)
+
+def test_flushes_when_the_window_expires(server, wavs):
+    client = FakeSarvamAI(latency=0, latency_per_file=0)
+    batcher = batcher_for(server, client, window_seconds=0.3, max_files=10)
+    started = time.perf_counter()
+    transcribe_concurrently(batcher, wavs)
+    assert time.perf_counter() - started >= 0.3
+    assert client.jobs_created == 1
+    assert batcher.stats() == {"jobs": 1, "files": 3, "waiting": 0}
+
+def test_flushes_at_max_files_without_waiting_for_the_window(server, wavs):
+    client = FakeSarvamAI(latency=0, latency_per_file=0)
+    batcher = batcher_for(server, client, window_seconds=60, max_files=3)
+    started = time.perf_counter()
+    transcribe_concurrently(batcher, wavs)
+    assert time.perf_counter() - started < 5
+    assert client.jobs_created == 1
+
+def test_each_caller_gets_its_own_files_output(server, wavs):
+    client = FakeSarvamAI(latency=0.1, latency_per_file=0)
+    results = transcribe_concurrently(batcher_for(server, client, window_seconds=0.3, max_files=10), wavs)
+    assert client.jobs_created == 1
+    for i, path in enumerate(wavs, 1):
+        entries = results[path]["diarized_transcript"]["entries"]
+        assert len(entries) == i  # one 2.5 s cue per 2.5 s of audio
+        assert all(entry["transcript"].startswith(f"clip{i}.wav ") for entry in entries)
+
+def test_a_failed_job_fails_every_waiter_in_its_batch(server, wavs):
+    client = FakeSarvamAI(latency=0, latency_per_file=0, failure_rate=1.0)
+    results = transcribe_concurrently(batcher_for(server, client, window_seconds=0.3, max_files=10), wavs)
+    assert client.jobs_created == 1
+    assert all(isinstance(results[path], Exception) and "failed" in str(results[path]) for path in wavs)
@@ -0,0 +1,87 @@
+import json
+import threading
+
+import pytest
+
+class StubModel:
+    """Records every prompt and answers it in reverse order, upper-casing the text"""
+
+    def __init__(self, server, drop=()):
+        self.server = server
+        self.prompts = []
+        self.drop = set(drop)  # cue numbers left out of their first reply
+        self.lock = threading.Lock()
+
+    def generate_content(self, prompt):
+        with self.lock:
+            self.prompts.append(prompt)
+        reply = []
+        for record in reversed(json.loads(prompt.rsplit("SUBTITLES TO TRANSLATE:\n", 1)[1])):
+            with self.lock:
+                if record["id"] in self.drop:
+                    self.drop.discard(record["id"])
+                    continue
+            reply.append({"id": record["id"], "emotion": "happy", "text": record["text"].upper()})
+
+        class Response:
+            text = json.dumps(reply)
+        return Response()
+
+    def windows(self):
+        """(cue numbers, context cue numbers) per prompt, in cue order"""
+        return sorted((self.ids(prompt.rsplit("SUBTITLES TO TRANSLATE:\n", 1)[1]), self.context_ids(prompt))
+                      for prompt in self.prompts)
+
+    def ids(self, records):
+        return [record["id"] for record in json.loads(records)]
+
+    def context_ids(self, prompt):
+        if "PRECEDING SUBTITLES" not in prompt:
+            return []
+        section = prompt.split("PRECEDING SUBTITLES", 1)[1].split(":\n", 1)[1]
+        return self.ids(section.split("\n\nSUBTITLES TO TRANSLATE:", 1)[0])
+
+def make_srt(count):
+    return "\n".join(f"{i}\n00:00:{i:02d},000 --> 00:00:{i:02d},900\nline {i}\n" for i in range(1, count + 1))
+
+@pytest.fixture
+def windowed(server, monkeypatch):
+    monkeypatch.setattr(server, "TRANSLATION_WINDOW_CUES", 3)
+    monkeypatch.setattr(server, "TRANSLATION_CONTEXT_CUES", 2)
+    return server
+
+def test_splits_cues_into_windows_with_preceding_context(windowed):
+    model = StubModel(windowed)
+    windowed.translate_srt_with_gemini(make_srt(7), "fr", model=model)
+    assert model.windows() == [
+        ([1, 2, 3], []),
+        ([4, 5, 6], [2, 3]),
+        ([7], [5, 6]),
+    ]
+
+def test_keeps_source_numbers_and_timestamps(windowed):
+    model = StubModel(windowed)
+    out = windowed.parse_srt(windowed.translate_srt_with_gemini(make_srt(7), "fr", model=model))
+    source = windowed.parse_srt(make_srt(7))
+    assert [(c["index"], c["start"], c["end"]) for c in out] == [(c["index"], c["start"], c["end"]) for c in source]
+    assert [c["text"] for c in out] == [f"[happy] LINE {i}" for i in range(1, 8)]
+
+def test_resends_only_the_cues_missing_from_a_reply(windowed):
+    model = StubModel(windowed, drop={5})
+    out = windowed.parse_srt(windowed.translate_srt_with_gemini(make_srt(7), "fr", model=model))
+    assert [c["text"] for c in out] == [f"[happy] LINE {i}" for i in range(1, 8)]
+    assert model.windows() == [
+        ([1, 2, 3], []),
+        ([4, 5, 6], [2, 3]),
+        ([5], [2, 3]),
+        ([7], [5, 6]),
+    ]
+
+def test_cached_cues_are_not_sent_again(windowed, tmp_path):
+    cache = windowed.TranslationCache(str(tmp_path / "cache.db"))
+    first = windowed.translate_srt_with_gemini(make_srt(4), "fr", model=StubModel(windowed), cache=cache)
+    model = StubModel(windowed)
+    # The first four cues keep their text and context, so only 5-7 are new
+    again = windowed.translate_srt_with_gemini(make_srt(7), "fr", model=model, cache=cache)
+    assert model.windows() == [([5, 6, 7], [3, 4])]
+    assert windowed.parse_srt(again)[:4] == windowed.parse_srt(first)
@@ -0,0 +1,48 @@
+import asyncio
+
+from uploads import MAX_UPLOAD_BYTES, MULTIPART_OVERHEAD
+
+def test_oversized_upload_is_rejected_with_cors_headers(server):
+    from fastapi.testclient import TestClient
+    client = TestClient(server.app)
+    response = client.post("/generate-subtitles", content=b"",
+                           headers={"Origin": "https://example.com",
+                                    "Content-Length": str(MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD + 1)})
+    assert response.status_code == 413
+    assert response.headers.get("access-control-allow-origin") == "https://example.com"
+
+def test_chunked_upload_without_length_is_cut_off_at_the_cap(server, monkeypatch):
+    import uploads
+    monkeypatch.setattr(uploads, "MULTIPART_OVERHEAD", 0)
+    app = server.FastAPI()
+    uploads.add_upload_limit(app, max_bytes=1024)
+
+    @app.post("/upload")
+    async def upload(file: server.UploadFile = server.File(...)):
+        return {"size": len(await file.read())}
+
+    def post(size):
+        """Send a multipart body of `size` bytes in 256-byte chunks with no Content-Length"""
+        chunks = [b'--x\r\nContent-Disposition: form-data; name="file"; filename="a.bin"\r\n\r\n',
+                  *[b"\0" * 256] * (size // 256), b"\r\n--x--\r\n"]
+        pulled, messages = 0, []
+
+        async def receive():
+            nonlocal pulled
+            pulled += 1
+            return {"type": "http.request", "body": chunks[pulled - 1], "more_body": pulled < len(chunks)}
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {"type": "http", "method": "POST", "path": "/upload", "raw_path": b"/upload",
+                 "query_string": b"", "root_path": "", "scheme": "http", "http_version": "1.1",
+                 "server": ("test", 80), "client": ("test", 1),
+                 "headers": [(b"content-type", b"multipart/form-data; boundary=x")]}
+        asyncio.run(app(scope, receive, send))
+        return messages[0]["status"], pulled, len(chunks)
+
+    assert post(512)[0] == 200
+    status, pulled, total = post(1 << 20)
+    assert status == 413
+    assert pulled < 10 < total  # stopped a few chunks past the cap, not at the end of the body
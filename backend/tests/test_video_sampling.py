@@ -0,0 +1,69 @@
+import cv2
+import numpy as np
+import pytest
+
+import finger
+
+@pytest.fixture(scope="module")
+def inter_coded_clip(tmp_path_factory):
+    """40 s of inter-coded MPEG-4 Part 2 (P frames between keyframes), every frame distinct"""
+    path = str(tmp_path_factory.mktemp("video") / "clip.mp4")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), 10, (160, 120))
+    if not writer.isOpened():
+        pytest.skip("no MPEG-4 encoder in this OpenCV build")
+    rng = np.random.default_rng(0)
+    blocks = rng.integers(0, 256, (400, 12, 16, 3), dtype=np.uint8)
+    for i in range(400):
+        writer.write(cv2.resize(blocks[i], (160, 120), interpolation=cv2.INTER_NEAREST))
+    writer.release()
+    return path
+
+def sequential_hashes(path, step):
+    """pHashes of the sample frames, read one frame after another with no seeking"""
+    cap = cv2.VideoCapture(path)
+    hashes, index = [], 0
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if index == finger._sampled_frame(len(hashes), step):
+            hashes.append((finger.phash_frame(frame), index))
+        index += 1
+    cap.release()
+    return hashes
+
+def test_seeked_ranges_match_a_sequential_read(inter_coded_clip):
+    _, _, step = finger.video_sampling(inter_coded_clip)
+    expected = sequential_hashes(inter_coded_clip, step)
+    assert len(expected) == 80
+    for first in (1, 17, 33, 61):
+        assert finger.hash_frame_range(inter_coded_clip, step, first, first + 5) == expected[first:first + 5]
+
+def test_parallel_ranges_match_one_worker(inter_coded_clip, monkeypatch):
+    monkeypatch.setattr(finger, "VIDEO_MIN_SEGMENT_SECONDS", 5)
+    sequential = finger.video_fingerprint(inter_coded_clip, workers=1)
+    assert finger.video_fingerprint(inter_coded_clip, workers=4) == sequential
+
+class InexactSeekCapture:
+    """A capture whose seeks land `miss` frames off the target, as on a long-GOP stream"""
+
+    def __init__(self, cap, miss):
+        self.cap = cap
+        self.miss = miss
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            value = max(value + self.miss, 0)
+        return self.cap.set(prop, value)
+
+    def __getattr__(self, name):
+        return getattr(self.cap, name)
+
+@pytest.mark.parametrize("miss", [-7, 3])
+def test_inexact_seeks_still_reach_the_sample_frame(inter_coded_clip, monkeypatch, miss):
+    _, _, step = finger.video_sampling(inter_coded_clip)
+    expected = sequential_hashes(inter_coded_clip, step)
+    open_capture = cv2.VideoCapture
+    monkeypatch.setattr(cv2, "VideoCapture", lambda path: InexactSeekCapture(open_capture(path), miss))
+    for first in (17, 61):
+        assert finger.hash_frame_range(inter_coded_clip, step, first, first + 5) == expected[first:first + 5]
@@ -0,0 +1,30 @@
+"""Whisper transcription in the parallel transcription pool.
+
+The pool spawns its workers, and a spawned worker imports the module its
+initializer and tasks live in. Keeping them here means a worker loads
+whisper and numpy only, not test.py with its FastAPI app, SQLite stores
+and model manager.
+"""
+import numpy as np
+import torch
+import whisper
+
+_model = None
+
+def init_worker(model_name: str, threads: int):
+    """Pool initializer: split the cores between workers and load this worker's model"""
+    global _model
+    torch.set_num_threads(threads)
+    _model = whisper.load_model(model_name)
+
+def shifted_segments(result: dict, offset: float) -> list:
+    """Segments of a transcribe() result on the full-file timeline"""
+    return [
+        {"start": segment["start"] + offset, "end": segment["end"] + offset, "text": segment["text"]}
+        for segment in result["segments"]
+    ]
+
+def transcribe_chunk(audio: np.ndarray, language: str, offset: float) -> list:
+    """Transcribe one chunk with this worker's model and return its segments on the full-file timeline"""
+    result = _model.transcribe(audio, language=language, verbose=False, task="transcribe")
+    return shifted_segments(result, offset)
@@ -0,0 +1,92 @@
+import os
+import hashlib
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+
+# ================= CONFIGURATION =================
+UPLOAD_CHUNK_SIZE = 1024 * 1024                 # bytes held in memory per read
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", 2 * 1024 ** 3))
+MULTIPART_OVERHEAD = 64 * 1024                  # slack for form fields and boundaries
+
+def too_large(max_bytes=MAX_UPLOAD_BYTES):
+    return HTTPException(status_code=413, detail=f"Upload exceeds the {max_bytes} byte limit")
+
+async def stream_upload(file, path, max_bytes=MAX_UPLOAD_BYTES, chunk_size=UPLOAD_CHUNK_SIZE):
+    """Copy an UploadFile to path chunk by chunk and return (size, sha256 hex).
+
+    At most chunk_size bytes are held in memory, and the content hash is
+    computed in the same pass. Raises 413 as soon as the upload passes
+    max_bytes; the partial file is removed on any failure.
+    """
+    if file.size is not None and file.size > max_bytes:
+        raise too_large(max_bytes)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(path, "wb") as out:
+            while True:
+                chunk = await file.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise too_large(max_bytes)
+                digest.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        if os.path.exists(path):
+            os.unlink(path)
+        raise
+    return size, digest.hexdigest()
+
+class UploadLimitMiddleware:
+    """ASGI middleware capping request bodies at max_bytes plus multipart slack.
+
+    A declared Content-Length over the cap is refused before any of the body
+    is read. Otherwise the body is counted as it arrives, so a chunked upload
+    with no length is cut off with 413 as soon as it passes the cap instead
+    of being spooled to disk in full by the multipart parser.
+    """
+
+    def __init__(self, app, max_bytes=MAX_UPLOAD_BYTES):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.limit = max_bytes + MULTIPART_OVERHEAD
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        length = dict(scope["headers"]).get(b"content-length", b"")
+        if length.isdigit() and int(length) > self.limit:
+            return await self._reject(scope, receive, send)
+        received = 0
+        started = False
+
+        async def counted_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.limit:
+                    # FastAPI passes this through from form parsing and answers it as a 413
+                    raise too_large(self.max_bytes)
+            return message
+
+        async def tracked_send(message):
+            nonlocal started
+            started = started or message["type"] == "http.response.start"
+            await send(message)
+
+        try:
+            await self.app(scope, counted_receive, tracked_send)
+        except HTTPException as e:
+            if e.status_code != 413 or started:
+                raise
+            await self._reject(scope, receive, send)
+
+    async def _reject(self, scope, receive, send):
+        await JSONResponse(status_code=413, content={"detail": too_large(self.max_bytes).detail})(scope, receive, send)
+
+def add_upload_limit(app, max_bytes=MAX_UPLOAD_BYTES):
+    """Cap request bodies at max_bytes, whether or not the client declares a Content-Length."""
+    app.add_middleware(UploadLimitMiddleware, max_bytes=max_bytes)